@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Benchmarks for the tinyDisplay system
+
+Run from the root of the repository::
+
+    python benchmarks/benchmark.py -o results.json
+    python benchmarks/benchmark.py -o new.json --compare results.json
+
+Each benchmark is run for a number of rounds after a warmup and the per-call
+timings (in seconds) are saved as JSON so that results can be compared between
+versions.  A benchmark that cannot run records the reason instead of timings.
+
+.. versionadded:: 0.0.1
+"""
+import argparse
+import json
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from PIL import ImageFont
+
+import tinyDisplay
+from tinyDisplay.font import tdImageFont
+from tinyDisplay.render.manager import manager
+from tinyDisplay.render.widget import canvas, text, scroll, slide, popUp, rectangle
+from tinyDisplay.utility import dataset
+
+_root = pathlib.Path(__file__).resolve().parent.parent
+_benchmarks = []
+
+
+def benchmark(group, number=100):
+    '''
+    Register a benchmark.  The decorated function performs any setup and returns
+    the function to be timed.  Each round times number calls of that function.
+    '''
+    def _register(f):
+        _benchmarks.append((f'{group}.{f.__name__}', f, number))
+        return f
+    return _register
+
+
+def _sampleData():
+    return {
+        'db': {
+            'album': "Ten Summoner's Tales", 'artist': 'Sting', 'title': 'Fields of Gold', 'duration': 220,
+            'elapsed': 10, 'length': 220, 'plLen': 12, 'plPos': 3, 'random': False, 'repeat': False,
+            'seek': 0, 'single': False, 'state': 'play', 'stream': '', 'volume': 50
+        },
+        'sys': {'temp': 54.3, 'time': time.localtime()},
+        'cfg': {'tempCF': 'f'},
+        'weather': {'conditions': 'Sunny', 'tempMax': 80, 'tempMin': 60, 'tempOutside': 72},
+    }
+
+
+def _trueTypeFont(size=10):
+    for name in ('DejaVuSansMono.ttf', 'DejaVuSans.ttf', 'LiberationMono-Regular.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    raise RuntimeError('No TrueType font found on this system')
+
+
+@benchmark('text')
+def bmfont_render():
+    ds = dataset({'db': {'title': ''}})
+    w = text(value="db['title']", dataset=ds, font=tdImageFont(_root / 'tinyDisplay/fonts/hd44780.fnt'))
+    titles = [f'Fields of Gold {i}' for i in range(10)]
+    state = {'i': 0}
+
+    def run():
+        state['i'] = (state['i'] + 1) % len(titles)
+        ds.update('db', {'title': titles[state['i']]})
+        w.render()
+    return run
+
+
+@benchmark('text')
+def truetype_render():
+    ds = dataset({'db': {'title': ''}})
+    w = text(value="db['title']", dataset=ds, font=_trueTypeFont())
+    titles = [f'Fields of Gold {i}' for i in range(10)]
+    state = {'i': 0}
+
+    def run():
+        state['i'] = (state['i'] + 1) % len(titles)
+        ds.update('db', {'title': titles[state['i']]})
+        w.render()
+    return run
+
+
+@benchmark('text', number=1000)
+def unchanged_render():
+    w = text(value="'Fields of Gold'")
+    return w.render
+
+
+@benchmark('marquee', number=1000)
+def scroll_step():
+    w = scroll(size=(60, 8), widget=text(value="'Fields of Gold by Sting'"), actions=[('rtl')])
+    return w.render
+
+
+@benchmark('marquee', number=1000)
+def slide_step():
+    w = slide(size=(60, 8), widget=text(value="'Fields of Gold'"), actions=[('rtl',), ('ltr',)])
+    return w.render
+
+
+@benchmark('marquee', number=1000)
+def popUp_step():
+    w = popUp(size=(60, 8), widget=text(value="'Fields of Gold\\nby Sting'"), delay=(2, 2))
+    return w.render
+
+
+@benchmark('canvas')
+def many_placements():
+    ds = dataset({'db': {'value': 0}})
+    widgets = [(text(value=f"str(db['value'] + {i})", dataset=ds), (i % 10 * 10, i // 10 * 8)) for i in range(40)]
+    c = canvas(size=(100, 32), dataset=ds, placements=widgets)
+    state = {'i': 0}
+
+    def run():
+        state['i'] += 1
+        ds.update('db', {'value': state['i']})
+        c.render()
+    return run
+
+
+@benchmark('canvas')
+def one_of_many_changed():
+    ds = dataset({'db': {'value': 0}})
+    widgets = [(rectangle(xy=(0, 0, 7, 7)), (i % 10 * 10, i // 10 * 8)) for i in range(39)]
+    widgets.append((text(value="str(db['value'])", dataset=ds), (0, 32)))
+    c = canvas(size=(100, 40), dataset=ds, placements=widgets)
+    state = {'i': 0}
+
+    def run():
+        state['i'] += 1
+        ds.update('db', {'value': state['i']})
+        c.render()
+    return run
+
+
+@benchmark('dataset', number=1000)
+def update():
+    ds = dataset(_sampleData())
+    state = {'i': 0}
+
+    def run():
+        state['i'] += 1
+        ds.update('db', {'elapsed': state['i']})
+    return run
+
+
+@benchmark('dataset', number=1000)
+def history():
+    ds = dataset(_sampleData())
+    for i in range(100):
+        ds.update('db', {'elapsed': i})
+        ds.update('sys', {'temp': 50 + i})
+
+    # history returns a view whose values are looked up when read.  Read every value so
+    # that results compare with versions that built the whole database
+    def run():
+        dict(ds.history('db', 50))
+    return run
+
+
+@benchmark('dataset', number=1000)
+def evaluate():
+    ds = dataset(_sampleData())
+    code = ds.compile("f\"{db['artist']} - {db['title']}\"")
+
+    def run():
+        ds.eval(code)
+    return run
+
+
+@benchmark('manager', number=1)
+def pagefile_load():
+    pf = _root / 'docs/pageFiles/pageFileExample.cfg'
+
+    def run():
+        manager(pageFile=str(pf), dataset=_sampleData(), displaySize=(100, 16))
+    return run
+
+
+# Page file for pagefile_render.  It only uses fonts bundled with tinyDisplay so that it
+# renders wherever the benchmarks are run from
+_renderPageFile = '''
+DISPLAY:
+  size: 100, 16
+
+FONTS:
+  small: hd44780.fnt
+
+WIDGETS:
+  title:
+    type: text
+    value: f"{db['title']} by {db['artist']}"
+    font: small
+    effect:
+      type: scroll
+      size: 100, 8
+      actions:
+        - pause, 10
+        - rtl
+  elapsed:
+    type: text
+    value: f"{db['elapsed'] // 60}:{db['elapsed'] % 60:02d}"
+    font: small
+  progress:
+    type: progressBar
+    value: db['elapsed']
+    range: [0, "db['length']"]
+    size: 40, 4
+  temp:
+    type: text
+    value: f"{sys['temp']:.0f}"
+    font: small
+  artist:
+    type: text
+    value: db['artist']
+    font: small
+
+CANVASES:
+  play:
+    size: 100, 16
+    placements:
+      - title, 0, 0
+      - elapsed, 0, 8
+      - progress, 30, 10
+      - temp, 80, 8
+  stop:
+    size: 100, 16
+    placements:
+      - artist, 0, 0
+      - temp, 0, 8
+
+SEQUENCES:
+  playing:
+    condition: db['state'] == 'play'
+    priority: 20
+    canvases:
+      - name: play
+        duration: 30
+  stopped:
+    condition: db['state'] == 'stop'
+    priority: 10
+    canvases:
+      - name: stop
+        duration: 30
+'''
+
+
+@benchmark('manager', number=10)
+def pagefile_render():
+    with tempfile.TemporaryDirectory() as d:
+        pf = pathlib.Path(d) / 'pageFile.yaml'
+        pf.write_text(_renderPageFile)
+        m = manager(pageFile=str(pf), dataset=_sampleData(), displaySize=(100, 16))
+    state = {'i': 0}
+
+    def run():
+        state['i'] += 1
+        m._dataset.update('db', {'elapsed': state['i'] % 220})
+        m.render()
+    return run
+
+
+def run(names=None, rounds=10, warmup=1):
+    results = {}
+    for name, f, number in _benchmarks:
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            func = f()
+            for i in range(warmup * number):
+                func()
+            times = []
+            for i in range(rounds):
+                start = time.perf_counter()
+                for j in range(number):
+                    func()
+                times.append((time.perf_counter() - start) / number)
+            results[name] = {
+                'rounds': rounds,
+                'number': number,
+                'min': min(times),
+                'median': statistics.median(times),
+                'mean': statistics.mean(times),
+                'stdev': statistics.stdev(times) if len(times) > 1 else 0,
+            }
+        except Exception as ex:
+            results[name] = {'error': ''.join(traceback.format_exception_only(type(ex), ex)).strip()}
+        _report(name, results[name])
+    return results
+
+
+def _report(name, result, baseline=None):
+    if 'error' in result:
+        print(f'{name:<32} ERROR {result["error"]}')
+        return
+    line = f'{name:<32} {result["median"]*1e6:>12.1f}us  (min {result["min"]*1e6:.1f}us)'
+    if baseline and 'median' in baseline:
+        line += f'  {result["median"] / baseline["median"]:>6.2f}x baseline'
+    print(line)
+
+
+def compare(results, baseline):
+    print(f'\nCompared to {baseline["version"]} ({baseline["timestamp"]})')
+    for name, result in results.items():
+        _report(name, result, baseline['results'].get(name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the tinyDisplay benchmarks')
+    parser.add_argument('-o', '--output', help='file to save the results to as JSON')
+    parser.add_argument('-c', '--compare', help='JSON results from a previous run to compare against')
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='number of timed rounds per benchmark')
+    parser.add_argument('names', nargs='*', help='only run benchmarks whose names contain one of these values')
+    args = parser.parse_args(argv)
+
+    results = run(args.names, args.rounds)
+    output = {
+        'version': tinyDisplay.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fn:
+            json.dump(output, fn, indent=2)
+    if args.compare:
+        with open(args.compare) as fn:
+            compare(results, json.load(fn))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of the asyncio animation loop for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import asyncio
+
+import pytest
+
+from tinyDisplay.utility import animate, asyncAnimate
+
+
+def test_async_animate():
+
+    async def main():
+        count = [0]
+
+        def function(step=1):
+            count[0] += step
+            return count[0]
+
+        a = asyncAnimate(cps=100, function=function, queueSize=5)
+        a.start()
+
+        # Data ingest shares the loop with rendering
+        results = []
+        for i in range(10):
+            results.append(await a.get(1))
+        assert results == list(range(1, 11)), f'Unexpected results {results}'
+
+        a.pause()
+        await asyncio.sleep(0.05)
+        a._emptyQueue()
+        assert await a.get(0.05) is None, 'Animation produced results while paused'
+
+        await a.force(step=100)
+        retval = await a.get()
+        assert retval and retval >= 100, f'Forced render not returned.  Received {retval}'
+
+        a.restart()
+        frames = []
+        async for f in a:
+            frames.append(f)
+            if len(frames) == 3:
+                break
+        assert frames[1] - frames[0] == 100, 'Forced arguments were not kept for subsequent renders'
+
+        await a.stop()
+        assert a._task is None
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+def test_async_animate_awaitable():
+
+    async def main():
+        async def function():
+            await asyncio.sleep(0)
+            return 'frame'
+
+        a = asyncAnimate(cps=100, function=function)
+        a.start()
+        assert await a.get(1) == 'frame'
+        await a.stop()
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+def test_async_animate_overlapping_force():
+
+    async def main():
+        calls = []
+
+        def function(step=1):
+            calls.append(step)
+            return step
+
+        a = asyncAnimate(cps=100, function=function)
+        a.start()
+        a.pause()
+        await asyncio.sleep(0.05)
+        a._emptyQueue()
+        calls.clear()
+
+        # Both callers must be released and the latest arguments used
+        await asyncio.wait_for(asyncio.gather(a.force(step=1), a.force(step=2)), 2)
+        assert await a.get() == 2
+        assert calls == [2], f'Overlapping forces should share one render.  Rendered {calls}'
+
+        await a.stop()
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+@pytest.mark.parametrize("inFlight", [False, True])
+def test_async_animate_stop_during_force(inFlight):
+
+    async def main():
+        async def function():
+            await asyncio.sleep(0.5)
+            return 'frame'
+
+        a = asyncAnimate(cps=100, function=function)
+        a.start()
+        a.pause()
+        await asyncio.sleep(0.6)
+
+        # Stop either before run picks up the force or while the forced render is running
+        force = asyncio.get_event_loop().create_task(a.force())
+        await asyncio.sleep(0.05 if inFlight else 0)
+        await a.stop()
+
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(force, 1)
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+@pytest.mark.parametrize("renderTime, oversleep, dropped, lateness", [
+    (0, 0, 0, 0),
+    (0.025, 0, 2, 0),
+    (0.015, 0, 1, 0),
+    (0, 0.002, 0, 0.002),
+])
+def test_deadline_pacing(renderTime, oversleep, dropped, lateness):
+
+    # Frames are scheduled against a fake clock that only moves while sleeping or rendering
+    now = [0]
+
+    def clock():
+        return now[0]
+
+    def sleep(delay):
+        now[0] += delay + oversleep
+
+    def function():
+        now[0] += renderTime
+        if a.frames == 49:
+            a._running = False
+        return True
+
+    a = animate(cps=100, function=function, queueSize=100, pacing='deadline', clock=clock, sleep=sleep)
+    a._runDeadline()
+
+    stats = a.stats
+    assert stats['frames'] == 50
+    assert stats['dropped'] == dropped * 50, f'Unexpected dropped frames {stats}'
+    assert stats['renderTime']['max'] == pytest.approx(renderTime)
+    assert stats['lateness']['max'] == pytest.approx(lateness)
+    assert stats['lateness']['mean'] == pytest.approx(lateness)
+
+
+def test_deadline_thread():
+    a = animate(cps=100, function=lambda: True, pacing='deadline')
+    a.start()
+    assert a.get(1), 'Animation did not produce a result'
+    a.stop()
+    assert a.stats['frames'] > 0
@@ -103,3 +103,51 @@ def test_canvas_widget_change():
     img, m3 = c.render()
 
     assert m1 and m3 and not m2
+
+
+def test_canvas_damage():
+
+    db = {'artist': 'Sting', 'title': 'Desert Rose'}
+    ds = {'db': db}
+    a = text(value='db[\'artist\']', dataset=ds, size=(60, 8))
+    t = text(value='db[\'title\']', dataset=ds, size=(60, 8))
+    c = canvas(size=(80, 16), placements=((a, (0, 0)), (t, (10, 8))))
+    c.render()
+
+    img, changed = c.render()
+    assert not changed and c.damage == [], f'Unchanged canvas reported damage {c.damage}'
+
+    db['title'] = 'Fields of Gold'
+    img, changed = c.render()
+    assert changed and c.damage == [(10, 8, 70, 16)], f'Unexpected damage {c.damage}'
+
+    # Partial repaint must produce the same image as a full repaint
+    fresh = canvas(size=(80, 16), placements=((a, (0, 0)), (t, (10, 8))))
+    assert img == fresh.render()[0], 'Partially repainted canvas did not match full render'
+
+
+@pytest.mark.parametrize("mode", ['L', 'RGB'])
+def test_canvas_mode(mode):
+    from tinyDisplay.render.widget import progressBar, rectangle, scroll
+    from tinyDisplay.utility import dataset
+
+    def makeCanvas(mode):
+        ds = dataset({'db': {'artist': 'Sting', 'volume': 40}})
+        artist = text(value="db['artist']", dataset=ds, mode=mode)
+        s = scroll(size=(30, 8), widget=text(value="'Scrolling along nicely'", mode=mode), mode=mode)
+        pb = progressBar(value="db['volume']", size=(40, 6), dataset=ds, mode=mode)
+        r = rectangle(xy=(0, 0, 9, 7), outline='white', mode=mode)
+        c = canvas(size=(80, 16), dataset=ds, mode=mode, placements=[(artist, (0, 0)), (s, (40, 0)), (pb, (0, 9)), (r, (60, 8))])
+        return ds, c
+
+    dsMono, mono = makeCanvas('1')
+    dsOther, other = makeCanvas(mode)
+    for i in range(20):
+        if i == 10:
+            dsMono.update('db', {'artist': 'Moby', 'volume': 80})
+            dsOther.update('db', {'artist': 'Moby', 'volume': 80})
+        img, changed = mono.render()
+        oImg, oChanged = other.render()
+        assert oImg.mode == mode
+        assert changed == oChanged and mono.damage == other.damage
+        assert not ImageChops.difference(img.convert('L'), oImg.convert('L')).getbbox(), f'{mode} render {i} does not match mode 1 render'
@@ -59,3 +59,178 @@ def test_dsEval(updates, condition):
     ans = ds.eval(code)
 
     assert ans, f'{condition} failed for {updates}'
+
+
+@pytest.mark.parametrize("statement, dependencies", [
+    ("db['artist']", {('db', 'artist')}),
+    ("f\"{db['artist']} - {db['title']}\"", {('db', 'artist'), ('db', 'title')}),
+    ("db['title'].lower() + sys['temp']", {('db', 'title'), ('sys', 'temp')}),
+    ("db[sys['key']]", {('db', None), ('sys', 'key')}),
+    ("prev.db['artist']", {('db', None)}),
+    ("history('sys', 2)['temp']", {('sys', None)}),
+    ("changed(db['artist'])", None),
+    ("time.strftime('%H:%M', db['time'])", None),
+])
+def test_dependencies(statement, dependencies):
+    ds = dataset({'db': {'artist': 'Sting', 'title': 'Fields of Gold', 'time': 0}, 'sys': {'temp': 54.3, 'key': 'artist'}})
+    deps = ds.compile(statement)[2]
+    assert deps == (frozenset(dependencies) if dependencies is not None else None), \
+        f'Unexpected dependencies {deps} for {statement}'
+
+
+def test_eval_scope():
+    ds = dataset({'db': {'artist': 'Sting'}})
+    ds.update('db', {'artist': 'Moby'})
+
+    local = {'widget': {'name': 'artist'}}
+    code = ds.compile("widget['name'] + ':' + db['artist'] + ':' + prev.db['artist']", local)
+    assert ds.eval(code, dataset=local) == 'artist:Moby:Sting'
+    assert 'prev' not in ds.keys(), 'Evaluation added prev to the dataset\'s databases'
+    assert ds.prev is ds.prev, 'prev should only be rebuilt after an update'
+
+    p = ds.prev
+    ds.update('db', {'artist': 'Abba'})
+    assert ds.prev is not p and ds.prev.db['artist'] == 'Moby'
+
+
+def test_concurrent_eval():
+    import threading
+
+    class blockingDB(dict):
+        def __getitem__(self, key):
+            if key == 'block':
+                release.wait(5)
+            return super().__getitem__(key)
+
+    release = threading.Event()
+    ds = dataset({'db': blockingDB(block=True), 'sys': {'temp': 54.3}})
+    blocked = ds.compile("db['block']")
+    changed = ds.compile("changed(sys['temp'])")
+
+    t = threading.Thread(target=ds.eval, args=(blocked, ))
+    t.start()
+
+    # Must not wait for the blocked evaluation running in the other thread
+    result = []
+    u = threading.Thread(target=lambda: result.extend([ds.eval(changed), ds.eval(changed)]))
+    u.start()
+    u.join(2)
+    release.set()
+    t.join()
+
+    assert result == [False, False], 'Evaluation was serialized behind another thread\'s evaluation'
+    ds.update('sys', {'temp': 62.8})
+    assert ds.eval(changed), 'changed did not detect new value'
+
+
+def test_history():
+    import random
+    rnd = random.Random(1)
+
+    ds = dataset(historySize=7)
+    states = {'db': [{}], 'sys': [{}]}
+    evicted = {'db': 0, 'sys': 0}
+    log = []
+    for i in range(60):
+        db = rnd.choice(['db', 'sys'])
+        update = {rnd.choice('abcde'): i}
+        ds.update(db, dict(update))
+
+        # Track every state each database has been in and which updates have left the history
+        log.append(db)
+        if len(log) > 7:
+            evicted[log.pop(0)] += 1
+        states[db].append({**states[db][-1], **update})
+
+        for name, s in states.items():
+            for back in range(10):
+                expected = s[max(len(s) - 1 - back, evicted[name])]
+                h = {k: v for k, v in ds.history(name, back).items() if k != '__timestamp__'}
+                assert h == expected, f'history({name}, {back}) returned {h} instead of {expected}'
+
+            if len(s) > 1:
+                prev = {k: v for k, v in ds.prev[name].items() if k != '__timestamp__'}
+                assert prev == s[max(len(s) - 2, 1)], f'prev.{name} returned {prev}'
+
+
+def test_update_shared(tmp_path):
+    ds = dataset({'db': {'artist': 'Sting', 'title': 'Desert Rose'}}, historySize=2)
+    ds.update('db', {'artist': 'Moby'})
+    d = ds['db']
+    ds.update('db', {'title': 'Porcelain'})
+    ds.update('sys', {'temp': 54.3})
+    assert d['title'] == 'Desert Rose', 'Update should not change a version that readers may hold'
+    assert ds['db']['title'] == 'Porcelain' and ds['db']['artist'] == 'Moby'
+    assert len(ds['db']) == 3 and dict(ds['db']) == {**d, 'title': 'Porcelain', '__timestamp__': ds['db']['__timestamp__']}
+
+    # The starting position is the state before the updates still held in the ring buffer
+    start = {k: v for k, v in ds._dsStart['db'].items() if k != '__timestamp__'}
+    assert start == {'artist': 'Moby', 'title': 'Desert Rose'}, f'Unexpected starting position {start}'
+    assert 'sys' not in ds._dsStart
+
+    ds.save(tmp_path / 'ds.txt')
+    lines = (tmp_path / 'ds.txt').read_text().split('\n')
+    assert lines[0].startswith('# STARTED AT') and '"Desert Rose"' in lines[1] and '"Porcelain"' in lines[4]
+
+
+def test_transaction():
+    ds = dataset({'db': {'artist': 'Sting'}, 'sys': {'temp': 54.3}})
+    code = ds.compile("db['artist'] + str(sys['temp'])")
+
+    notified = []
+
+    class subscriber:
+        def invalidate(self):
+            notified.append(ds.eval(code))
+
+    s = subscriber()
+    ds.subscribe(code, s.invalidate)
+    entries = len(ds._ringBuffer)
+
+    with ds.transaction():
+        ds.update('db', {'artist': 'Moby'})
+        ds.update('sys', {'temp': 62.8})
+        ds.update('db', {'title': 'Porcelain'})
+        assert ds['db']['artist'] == 'Sting', 'Update was applied before the transaction completed'
+
+    assert notified == ['Moby62.8'], f'Subscribers should be notified once with all updates applied. Received {notified}'
+    assert len(ds._ringBuffer) == entries + 1, 'Transaction should be stored as a single update'
+    assert ds['db']['__timestamp__'] == ds['sys']['__timestamp__']
+    assert ds.history('db', 1)['artist'] == 'Sting'
+
+    with pytest.raises(ValueError):
+        with ds.transaction():
+            ds.update('db', {'artist': 'Abba'})
+            raise ValueError('Abandon transaction')
+    assert ds['db']['artist'] == 'Moby', 'Updates from a failed transaction were applied'
+
+
+def test_concurrent_update_and_eval():
+    import threading
+
+    ds = dataset({'db': {f'k{i}': i for i in range(50)}}, historySize=10)
+    ds.update('db', {'k0': 0})
+    code = ds.compile('sum(len(str(k)) for k in db)')
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        try:
+            while not done.is_set():
+                ds.eval(code)
+                dict(ds.history('db', 1))
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=reader) for i in range(2)]
+    for t in threads:
+        t.start()
+    for i in range(20000):
+        ds.update('db', {f'k{i}': i, 'k1': i})
+    done.set()
+    for t in threads:
+        t.join()
+
+    assert not errors, f'Concurrent evaluation failed with {errors[0]!r}'
+    assert len(ds['db']) == 20001 and ds['db']['k19999'] == 19999 and ds['db']['k1'] == 19999
+    assert set(ds['db']) == {f'k{i}' for i in range(20000)} | {'__timestamp__'}
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of Fonts for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import pytest
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+from tinyDisplay.font import tdImageFont, tdAtlasFont
+
+fontPath = Path(__file__).parent / '../tinyDisplay/fonts/hd44780.fnt'
+
+
+def drawText(fnt, value):
+    img = Image.new('1', fnt.getsize(value))
+    ImageDraw.Draw(img).text((0, 0), value, font=fnt, fill='white')
+    return img
+
+
+def test_font_cache():
+    fnt = tdImageFont(fontPath, cacheSize=2)
+    uncached = tdImageFont(fontPath, cacheSize=0)
+
+    for v in ['12:34', 'PLAY', '12:34', 'STOP', 'PLAY']:
+        assert drawText(fnt, v) == drawText(uncached, v), f'Cached rendering of {v} did not match'
+
+    info = fnt.cacheInfo
+    assert (info.hits, info.misses, info.currsize) == (1, 4, 2), f'Unexpected cache statistics {info}'
+
+
+@pytest.mark.parametrize("value", [
+    ('Hello World'),
+    ('12:34\nPLAY'),
+    ('▶ ⏹'),
+    ('\nmissing \U0001f525 glyph\n'),
+    (' '),
+])
+def test_atlas_font(value):
+    fnt = tdImageFont(fontPath, cacheSize=0)
+    atlas = tdAtlasFont(fontPath, cacheSize=0)
+
+    assert drawText(atlas, value) == drawText(fnt, value), f'Atlas rendering of {value!r} did not match'
+
+
+def test_font_cache_file(tmp_path, monkeypatch):
+    import tinyDisplay.font as font
+
+    value = 'Cached ▶ 12:34'
+    fnt = tdImageFont(fontPath, cacheDir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1, 'Compiled font was not written to the cache'
+
+    # Second load must come from the cache without parsing the font file
+    def fail(fileName):
+        raise AssertionError('Font file was parsed even though a compiled copy exists')
+    monkeypatch.setattr(font, '_readGlyphData', fail)
+    cached = tdImageFont(fontPath, cacheDir=tmp_path)
+
+    assert cached.lineHeight == fnt.lineHeight
+    assert drawText(cached, value) == drawText(fnt, value), 'Font loaded from cache rendered differently'
+
+
+def test_font_cache_page_change(tmp_path):
+    import shutil
+    from PIL import ImageOps
+
+    fonts = tmp_path / 'fonts'
+    fonts.mkdir()
+    for f in ('hd44780.fnt', 'hd44780a02.png', 'hd44780a00.png'):
+        shutil.copy(fontPath.parent / f, fonts / f)
+    cache = tmp_path / 'cache'
+
+    value = 'Page'
+    before = drawText(tdImageFont(fonts / 'hd44780.fnt', cacheDir=cache), value)
+
+    # Editing a page image without touching the font file must invalidate the cache
+    page = fonts / 'hd44780a02.png'
+    ImageOps.invert(Image.open(page).convert('L')).convert('1').save(page)
+    after = tdImageFont(fonts / 'hd44780.fnt', cacheDir=cache)
+
+    assert len(list(cache.iterdir())) == 2, 'Changed page image did not produce a new cache entry'
+    assert drawText(after, value) == drawText(tdImageFont(fonts / 'hd44780.fnt'), value)
+    assert drawText(after, value) != before
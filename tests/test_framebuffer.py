@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of packed framebuffers for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import random
+
+import pytest
+from PIL import Image
+
+from tinyDisplay.framebuffer import framebuffer, ssd1306, ssd1322, hd44780
+
+
+def randomImage(size, mode='1'):
+    rnd = random.Random(size[0] * 1000 + size[1])
+    img = Image.new(mode, size)
+    img.putdata([rnd.choice((0, 255)) if mode == '1' else rnd.randrange(256) for i in range(size[0] * size[1])])
+    return img
+
+
+@pytest.mark.parametrize("size", [(128, 64), (100, 16), (20, 13)])
+def test_ssd1306(size):
+    img = randomImage(size)
+    fb = ssd1306(size)
+    fb.update(img)
+
+    px = img.load()
+    expected = bytearray()
+    for p in range((size[1] + 7) // 8):
+        for x in range(size[0]):
+            b = 0
+            for k in range(8):
+                y = p * 8 + k
+                if y < size[1] and px[x, y]:
+                    b |= 1 << k
+            expected.append(b)
+    assert fb.buffer.tobytes() == bytes(expected)
+
+
+@pytest.mark.parametrize("mode", ['1', 'L'])
+def test_ssd1322(mode):
+    size = (256, 64)
+    img = randomImage(size, mode)
+    fb = ssd1322(size)
+    fb.update(img)
+
+    data = img.convert('L').tobytes()
+    expected = bytes((data[i] & 0xf0) | (data[i + 1] >> 4) for i in range(0, len(data), 2))
+    assert fb.buffer.tobytes() == expected
+
+
+@pytest.mark.parametrize("size, cellSize, spacing", [
+    ((100, 16), (5, 8), (0, 0)),
+    ((119, 35), (5, 8), (1, 1)),
+])
+def test_hd44780(size, cellSize, spacing):
+    img = randomImage(size)
+    fb = hd44780(size, cellSize=cellSize, spacing=spacing)
+    fb.update(img)
+
+    px = img.load()
+    cols, rows = fb.cells
+    expected = bytearray()
+    for r in range(rows):
+        for c in range(cols):
+            for y in range(cellSize[1]):
+                b = 0
+                for x in range(cellSize[0]):
+                    if px[c * (cellSize[0] + spacing[0]) + x, r * (cellSize[1] + spacing[1]) + y]:
+                        b |= 1 << (cellSize[0] - 1 - x)
+                expected.append(b)
+    assert (cols, rows) == ((size[0] + spacing[0]) // (cellSize[0] + spacing[0]), (size[1] + spacing[1]) // (cellSize[1] + spacing[1]))
+    assert fb.buffer.tobytes() == bytes(expected)
+
+
+def test_mapped_framebuffer(tmp_path):
+    fn = tmp_path / 'fb0'
+    img = randomImage((128, 32))
+    with ssd1306((128, 32), file=fn) as fb:
+        fb.update(img)
+        expected = fb.buffer.tobytes()
+    assert fn.read_bytes() == expected
+
+    # Reopening an existing device maps the same bytes
+    with ssd1306((128, 32), file=fn) as fb:
+        assert fb.buffer.tobytes() == expected
+
+
+@pytest.mark.parametrize("fb, unit", [
+    (ssd1306((128, 32)), 128),
+    (ssd1322((128, 32)), 64),
+    (hd44780((100, 16)), 8),
+])
+def test_diff(fb, unit):
+    img = randomImage(fb.size)
+    changes = fb.diff(img)
+    assert b''.join(c.data for c in changes) == fb.buffer.tobytes(), 'First diff should send the whole framebuffer'
+
+    assert fb.diff(img) == [], 'Unchanged frame should produce no changes'
+
+    # Change two small regions and apply the changes to a copy of the device's memory
+    device = bytearray(fb.buffer)
+    img2 = img.copy()
+    img2.paste(0, (3, 2, 9, 5))
+    img2.paste(1, (70, 20, 72, 30))
+    changes = fb.diff(img2)
+    for c in changes:
+        pos = c.unit * unit + c.start
+        device[pos: pos + len(c.data)] = c.data
+
+    assert bytes(device) == fb.buffer.tobytes(), 'Applying the changes did not reproduce the frame'
+    assert sum(len(c.data) for c in changes) < len(fb) / 4, 'Changes should only cover the modified regions'
+
+
+def test_diff_gap():
+    fb = ssd1306((128, 8))
+    img = Image.new('1', (128, 8))
+    fb.diff(img)
+
+    img.putpixel((10, 0), 1)
+    img.putpixel((13, 0), 1)
+    img.putpixel((100, 0), 1)
+    changes = fb.diff(img, gap=4)
+    assert [(c.start, len(c.data)) for c in changes] == [(10, 4), (100, 1)]
+
+    img.putpixel((10, 1), 1)
+    img.putpixel((13, 1), 1)
+    changes = fb.diff(img, gap=0)
+    assert [(c.start, len(c.data)) for c in changes] == [(10, 1), (13, 1)]
+
+
+def test_rgb565():
+    from tinyDisplay.framebuffer import rgb565
+
+    size = (16, 4)
+    rnd = random.Random(565)
+    img = Image.new('RGB', size)
+    img.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for i in range(size[0] * size[1])])
+    fb = rgb565(size)
+    fb.update(img)
+
+    expected = b''.join(
+        (((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)).to_bytes(2, 'big')
+        for r, g, b in img.getdata()
+    )
+    assert fb.buffer.tobytes() == expected
+
+
+def test_incomplete_framebuffer():
+    class incomplete(framebuffer):
+        def _length(self):
+            return 8
+
+    with pytest.raises(TypeError):
+        incomplete((8, 8))
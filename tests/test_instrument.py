@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of render tree instrumentation for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import json
+
+from tinyDisplay.instrument import profiler
+from tinyDisplay.render.widget import canvas, text, rectangle
+from tinyDisplay.utility import dataset
+
+
+def test_profiler(tmp_path):
+    ds = dataset({'db': {'artist': 'Sting'}})
+    artist = text(name='artist', value="db['artist']", dataset=ds)
+    box = rectangle(name='box', xy=(0, 0, 9, 7))
+    c = canvas(name='page', size=(80, 16), dataset=ds, placements=[(artist, (0, 0)), (box, (0, 8))])
+    c.render()
+
+    p = profiler().attach(c)
+    for i in range(10):
+        if i % 2:
+            ds.update('db', {'artist': f'Sting {i}'})
+        c.render()
+
+    stats = {s.name: s for s in p.stats()}
+    assert set(stats) == {'artist', 'box', 'page'}
+    assert stats['artist'].renders == 10
+    assert stats['artist'].changed == 5, f'Expected 5 changed renders.  Received {stats["artist"].changed}'
+    assert stats['box'].changedRatio == 0
+    assert stats['artist'].evalTime > 0
+    assert stats['page'].pasteTime > 0
+    assert stats['page'].renderTime >= stats['artist'].renderTime + stats['box'].renderTime
+    assert stats['page'].selfTime < stats['page'].renderTime
+
+    table = p.summary()
+    assert 'artist' in table and 'page' in table
+
+    fn = tmp_path / 'trace.json'
+    p.trace(fn)
+    trace = json.loads(fn.read_text())
+    assert len([e for e in trace['traceEvents'] if e['name'] == 'page' and e['cat'] == 'render']) == 10
+
+    p.detach()
+    c.render()
+    assert p.stats()[0].renders <= 10, 'Detached profiler should no longer record renders'
+    assert 'render' not in c.__dict__
+
+
+def test_detach_restores_overrides():
+    w = text(value="'Fields of Gold'")
+    original = w.render
+
+    def render(*args, **kwargs):
+        return original(*args, **kwargs)
+    w.render = render
+    r = rectangle(xy=(0, 0, 7, 7))
+
+    p = profiler().attach(w)
+    p.attach(r)
+    assert w.render is not render
+    p.detach()
+
+    assert w.__dict__['render'] is render, 'Instance override was not restored'
+    assert 'render' not in r.__dict__ and '_eval' not in w.__dict__
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of the manager's virtual clock and fast forward rendering
+
+.. versionadded:: 0.0.1
+"""
+import pytest
+
+from tinyDisplay.render.manager import manager
+from tinyDisplay.utility import dataset, virtualClock
+
+pageFile = '''
+DISPLAY:
+  size: 40, 16
+
+FONTS:
+  small: hd44780.fnt
+
+WIDGETS:
+  artist:
+    type: text
+    value: db['artist']
+    effect:
+      type: scroll
+      size: 40, 8
+      actions:
+        - rtl
+  seconds:
+    type: text
+    value: str(db['seconds'])
+
+CANVASES:
+  play:
+    size: 40, 16
+    placements:
+      - artist, 0, 0
+      - seconds, 0, 8
+  stop:
+    size: 40, 16
+    placements:
+      - seconds, 0, 0
+
+SEQUENCES:
+  playing:
+    condition: db['state'] == 'play'
+    canvases:
+      - name: play
+        duration: 5
+      - name: stop
+        duration: 2
+'''
+
+
+@pytest.fixture(scope='function')
+def makeManager(tmp_path):
+    pf = tmp_path / 'page.yaml'
+    pf.write_text(pageFile)
+
+    def _make_manager(clock):
+        return manager(pageFile=str(pf), dataset={'db': {'artist': 'Sting and the Police', 'seconds': 0, 'state': 'play'}},
+            displaySize=(40, 16), clock=clock)
+
+    yield _make_manager
+
+
+def test_virtual_clock():
+    vc = virtualClock(10)
+    assert vc() == 10
+    assert vc.advance(2.5) == 12.5
+    vc.set(20)
+    assert vc() == 20
+    with pytest.raises(AssertionError):
+        vc.set(19)
+
+    ds = dataset({'db': {'value': 0}}, clock=vc)
+    vc.advance(3)
+    ds.update('db', {'value': 1})
+    assert ds.db['__timestamp__'] == 3
+
+
+def test_fast_forward(makeManager):
+    # Rendering in real time and fast forwarding must produce the same frames
+    reference = makeManager(virtualClock(0))
+    expected = []
+    for i in range(300):
+        if i == 150:
+            reference._dataset.update('db', {'seconds': 5})
+        expected.append(reference.render()[0].tobytes())
+        reference._clock.advance(1 / 30)
+
+    frames = []
+    m = makeManager(virtualClock(0))
+    stats = m.fastForward(10, fps=30, timeline=[(5, 'db', {'seconds': 5})], callback=lambda img: frames.append(img.tobytes()))
+
+    assert stats['frames'] == 300
+    assert m._clock() == 10
+    assert frames == expected
+
+    # The play canvas scrolls for five seconds and then the stop canvas is shown for two
+    assert len(set(frames[:150])) > 1
+    assert len(set(frames[151:210])) == 1
+    assert frames[151] != frames[150]
+
+
+def test_fast_forward_saved_timeline(makeManager, tmp_path):
+    vc = virtualClock(0)
+    ds = dataset({'db': {'artist': 'Sting', 'seconds': 0, 'state': 'play'}}, clock=vc)
+    for i in range(1, 4):
+        vc.advance(1)
+        ds.update('db', {'seconds': i})
+    ds.save(tmp_path / 'ds.txt')
+
+    m = makeManager(virtualClock(0))
+    m.fastForward(3.5, fps=10, timeline=tmp_path / 'ds.txt')
+    assert m._dataset.db['seconds'] == 3
+    assert m._dataset.db['artist'] == 'Sting'
+
+
+def test_fast_forward_requires_virtual_clock(makeManager):
+    with pytest.raises(AssertionError):
+        makeManager(None).fastForward(1)
+
+
+def test_dataset_clock(tmp_path):
+    pf = tmp_path / 'page.yaml'
+    pf.write_text(pageFile)
+    vc = virtualClock(0)
+    ds = dataset({'db': {'artist': 'Sting', 'seconds': 0, 'state': 'play'}}, clock=vc)
+
+    # A dataset's clock is used when the manager isn't given one
+    m = manager(pageFile=str(pf), dataset=ds, displaySize=(40, 16))
+    m.fastForward(2, fps=10, timeline=[(1, 'db', {'seconds': 1})])
+    assert ds.db['__timestamp__'] == pytest.approx(1)
+
+    with pytest.raises(AssertionError):
+        manager(pageFile=str(pf), dataset=ds, displaySize=(40, 16), clock=virtualClock(0))
+    with pytest.raises(AssertionError):
+        manager(pageFile=str(pf), dataset=dataset(), displaySize=(40, 16), clock=vc)
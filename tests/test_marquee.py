@@ -258,3 +258,77 @@ def test_popup():
     while not pu.atPause:
         pu.render()
     assert pu.render()[0] == top
+
+
+def test_timeline():
+    from tinyDisplay.render.widget import _timeline
+
+    tl = _timeline()
+    expected = []
+
+    tl.append((0, 0))
+    expected.append((0, 0))
+
+    # 10 second pause at 60 ticks per second
+    tl.addSegment((0, 0), 600)
+    expected += [(0, 0)] * 600
+
+    # Move left 2 pixels per step holding each position for 3 ticks
+    tl.addSegment((-2, 0), 30, (-2, 0), 3)
+    expected += [(-2 * (i // 3 + 1), 0) for i in range(30)]
+
+    assert len(tl._segments) == 3, 'Timeline should store segments not ticks'
+    assert len(tl) == len(expected)
+    assert [tl[i] for i in range(len(tl))] == expected
+    assert tl[-1] == expected[-1] and tl[-31] == expected[-31]
+
+    assert tl.pop() == expected.pop()
+    assert len(tl) == len(expected) and tl[-1] == expected[-1]
+
+    with pytest.raises(IndexError):
+        tl[len(tl)]
+
+
+@pytest.mark.parametrize("actions, gap", [
+    ([('rtl')], None),
+    ([('ltr')], (3, 0)),
+    ([('ttb')], None),
+    ([('rtl',), ('btt',)], (2, 2)),
+])
+def test_scroll_strip(actions, gap):
+    w = text(value="'Scrolling\\nText'")
+    sw = scroll(size=(20, 10), widget=w, actions=actions, gap=gap)
+
+    for i in range(len(sw._timeline) + 5):
+        img, changed = sw.render()
+        strip = sw._strip
+        sw._strip = None
+        expected = sw._paintScrolledWidget()
+        sw._strip = strip
+        assert not ImageChops.difference(img, expected).getbbox(), f'Strip frame differs from painted frame at tick {i}'
+    assert sw._strip, 'Strip was not built'
+
+
+@pytest.mark.parametrize("cls, kwargs", [
+    (scroll, {'actions': [('rtl')]}),
+    (popUp, {'delay': (0.1, 0.1)}),
+])
+def test_frame_cache(cls, kwargs):
+    from tinyDisplay.utility import dataset
+    ds = dataset({'db': {'value': 'Scrolling Text\nMore Text'}})
+    cached = cls(size=(20, 8), widget=text(value="db['value']", dataset=ds), dataset=ds, frameCache=1000, **kwargs)
+    plain = cls(size=(20, 8), widget=text(value="db['value']", dataset=ds), dataset=ds, **kwargs)
+
+    cycle = len(cached._timeline)
+    for i in range(cycle * 3):
+        if i == cycle * 2:
+            ds.update('db', {'value': 'Other Text\nMore'})
+        img, changed = cached.render()
+        pImg, pChanged = plain.render()
+        assert changed == pChanged
+        assert not ImageChops.difference(img, pImg).getbbox(), f'Cached frame differs at tick {i}'
+
+    info = cached.cacheInfo()
+    assert info.hits > 0, 'Frames were not replayed from the cache'
+    assert info.currsize <= len(set(cached._timeline[i] for i in range(len(cached._timeline))))
+    assert plain.cacheInfo() is None
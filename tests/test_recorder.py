@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of recording rendered output for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import pytest
+from PIL import Image, ImageChops, ImageSequence
+
+from tinyDisplay.recorder import recorder, readRaw
+from tinyDisplay.render.widget import text, scroll
+
+
+def frames():
+    # Ten frames of a scroll followed by five unchanged frames then one more scroll step
+    sw = scroll(size=(20, 8), widget=text(value="'Recording'"), actions=[('rtl')])
+    retval = [sw.render()[0] for i in range(10)]
+    retval += [retval[-1]] * 5
+    retval.append(sw.render()[0])
+    return retval
+
+
+@pytest.mark.parametrize("ext", ['gif', 'png', 'raw'])
+def test_recorder(tmp_path, ext):
+    fn = tmp_path / f'recording.{ext}'
+    imgs = frames()
+    with recorder(fn, fps=20) as rec:
+        write = rec.wrap(lambda i: (imgs[i], True))
+        for i in range(len(imgs)):
+            write(i)
+
+    assert rec.frames == 16 and rec.distinct == 11
+    assert rec.distinctRate == pytest.approx(11 * 20 / 16)
+
+    expected = imgs[:10] + imgs[15:]
+    durations = [50] * 9 + [300, 50]
+    if ext == 'raw':
+        fps, recording = readRaw(fn)
+        recording = list(recording)
+        assert fps == 20
+        assert [c for img, c in recording] == [d // 50 for d in durations]
+        recorded = [img for img, c in recording]
+    else:
+        im = Image.open(fn)
+        recorded, recordedDurations = [], []
+        for f in ImageSequence.Iterator(im):
+            recorded.append(f.convert('1'))
+            recordedDurations.append(f.info['duration'])
+        assert recordedDurations == durations
+
+    assert len(recorded) == len(expected)
+    for r, e in zip(recorded, expected):
+        assert not ImageChops.difference(r.convert('L'), e.convert('L')).getbbox(), 'Recorded frame does not match'
+
+
+def test_recorder_no_dedupe(tmp_path):
+    fn = tmp_path / 'recording.raw'
+    imgs = frames()
+    with recorder(fn, fps=20, dedupe=False) as rec:
+        for img in imgs:
+            rec.write(img)
+    fps, recording = readRaw(fn)
+    assert [c for img, c in recording] == [1] * 16
+    assert rec.distinct == 11
+
+
+@pytest.mark.parametrize("ext", ['gif', 'png'])
+def test_recorder_long_hold(tmp_path, ext):
+    # A hold longer than a single frame's maximum delay is split across repeated frames
+    fn = tmp_path / f'recording.{ext}'
+    imgs = frames()
+    with recorder(fn, fps=20) as rec:
+        for i in range(700 * 20):
+            rec.write(imgs[0])
+        rec.write(imgs[1])
+
+    durations = [f.info['duration'] for f in ImageSequence.Iterator(Image.open(fn))]
+    assert sum(durations[:-1]) == 700000 and durations[-1] == 50
+    if ext == 'gif':
+        assert max(durations) <= 655350
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Test of Sequence and Collection classes for the tinyDisplay system
+
+.. versionadded:: 0.0.1
+"""
+import pytest
+from PIL import Image
+
+from tinyDisplay.render.widget import text, canvas
+from tinyDisplay.render.sequence import sequence, collection
+
+
+@pytest.fixture(scope='function')
+def makeCollection(request):
+
+    def _make_collection(db):
+        ds = {'db': db}
+        w = text(value='db[\'artist\']', dataset=ds, size=(60, 8))
+        c = canvas(size=(60, 8), placements=((w, ), ))
+        s = sequence(condition='db[\'state\']==\'play\'', dataset=ds, canvases=[(c, 10)])
+        col = collection(size=(80, 16))
+        col.append(sequence=s, placement=(10, 8))
+        return col
+
+    yield _make_collection
+
+
+def test_collection_reuse(makeCollection):
+    db = {'artist': 'Sting', 'state': 'play'}
+    col = makeCollection(db)
+
+    img1, changed = col.render()
+    assert changed, 'First render of collection should report changed'
+
+    img2, changed = col.render()
+    assert not changed and img2 is img1 and col.damage == [], \
+        'Unchanged collection should return the same image with no damage'
+
+    db['artist'] = 'Moby'
+    img3, changed = col.render()
+    assert changed and col.damage == [(10, 8, 70, 16)], f'Unexpected damage {col.damage}'
+    assert img3 is not img1, 'Collection modified an image that was already returned'
+
+
+def test_collection_default_canvas(makeCollection):
+    db = {'artist': 'Sting', 'state': 'play'}
+    col = makeCollection(db)
+    col.render()
+
+    db['state'] = 'stop'
+    img, changed = col.render()
+    assert changed and img == Image.new('1', (80, 16)), 'Collection should show the default canvas'
+
+    img, changed = col.render()
+    assert not changed, 'Default canvas should not be re-rendered once it is visible'
+
+
+def test_render_ahead():
+    from PIL import ImageChops
+    from tinyDisplay.render.sequence import renderAhead
+    from tinyDisplay.render.widget import canvas, scroll, text
+    from tinyDisplay.utility import dataset
+
+    def makeCanvas(ds):
+        s = scroll(size=(30, 8), widget=text(value="'Scrolling along nicely'", dataset=ds), dataset=ds)
+        t = text(value="str(db['count'])", dataset=ds)
+        return canvas(size=(60, 16), dataset=ds, placements=[(s, (0, 0)), (t, (0, 8))])
+
+    dsA = dataset({'db': {'count': 0}})
+    dsB = dataset({'db': {'count': 0}})
+    expected = makeCanvas(dsA)
+    ra = renderAhead(makeCanvas(dsB), frames=8)
+
+    try:
+        for i in range(60):
+            if i % 15 == 7:
+                dsA.update('db', {'count': i})
+                dsB.update('db', {'count': i})
+            img, changed = expected.render()
+            raImg, raChanged = ra.get(2)
+            assert raChanged == changed, f'Frame {i} changed should be {changed}'
+            assert not ImageChops.difference(img, raImg).getbbox(), f'Frame {i} differs from directly rendered frame'
+    finally:
+        ra.stop()
+
+
+
+def test_render_ahead_update_in_flight():
+    from threading import Event
+    from PIL import ImageChops
+    from tinyDisplay.render.sequence import renderAhead
+    from tinyDisplay.render.widget import canvas, staticWidget, text
+    from tinyDisplay.utility import dataset
+
+    entered, release = Event(), Event()
+
+    class gate(staticWidget):
+        armed = False
+
+        def _render(self, *args, **kwargs):
+            if self.armed:
+                self.armed = False
+                entered.set()
+                release.wait(2)
+            return super()._render(*args, **kwargs)
+
+    def makeCanvas(ds):
+        g = gate(image=Image.new('1', (1, 1)), dataset=ds)
+        t = text(value="db['value']", dataset=ds)
+        return g, canvas(size=(40, 8), dataset=ds, placements=[(g, (0, 0)), (t, (0, 0))])
+
+    dsA = dataset({'db': {'value': 'before'}})
+    dsB = dataset({'db': {'value': 'before'}})
+    _, expected = makeCanvas(dsA)
+    g, c = makeCanvas(dsB)
+    ra = renderAhead(c, frames=3)
+
+    try:
+        # Hold the render of the fourth frame and update the text it is about to evaluate
+        img, changed = ra.get(2)
+        g.armed = True
+        ra.get(2)
+        assert entered.wait(2), 'Render ahead did not start the next frame'
+        dsA.update('db', {'value': 'after'})
+        dsB.update('db', {'value': 'after'})
+        release.set()
+
+        img, changed = expected.render()
+        assert changed
+        for i in range(3):
+            raImg, raChanged = ra.get(2)
+            assert raChanged == (i == 0), f'Frame {i} changed should be {i == 0}'
+            assert not ImageChops.difference(img, raImg).getbbox(), f'Frame {i} differs from directly rendered frame'
+    finally:
+        release.set()
+        ra.stop()
+
+
+def test_render_ahead_error():
+    from tinyDisplay.render.sequence import renderAhead
+    from tinyDisplay.render.widget import staticWidget
+
+    class broken(staticWidget):
+        renders = 0
+
+        def _render(self, *args, **kwargs):
+            self.renders += 1
+            if self.renders > 2:
+                raise ValueError('broken widget')
+            return super()._render(*args, **kwargs)
+
+    ra = renderAhead(broken(image=Image.new('1', (8, 8))), frames=5)
+    try:
+        # Frames rendered before the failure are returned first
+        assert ra.render() is not None
+        assert ra.render() is not None
+        with pytest.raises(ValueError):
+            ra.render()
+        with pytest.raises(ValueError):
+            ra.get(0)
+    finally:
+        ra.stop()
+
+def test_collection_processes():
+    from PIL import ImageChops
+    from tinyDisplay.utility import dataset
+
+    def makeCollection(processes):
+        ds = dataset({'db': {'artist': 'Sting', 'title': 'Fields of Gold', 'state': 'play'}})
+        col = collection(size=(80, 16), processes=processes, dataset=ds)
+        for i, (key, cond) in enumerate([('artist', "db['state']=='play'"), ('title', "db['state']!='stop'")]):
+            w = text(value=f"db['{key}']", dataset=ds)
+            c = canvas(size=(80, 8), placements=((w, ), ), dataset=ds)
+            s = sequence(condition=cond, dataset=ds, canvases=[(c, 10)], priority=10 + i)
+            col.append(sequence=s, placement=(0, i * 8))
+        return ds, col
+
+    dsA, serial = makeCollection(0)
+    dsB, pooled = makeCollection(2)
+    updates = [
+        {'artist': 'Moby'},
+        {'title': 'Porcelain'},
+        {'state': 'pause'},
+        {'state': 'stop'},
+        {'state': 'play', 'artist': 'Abba'},
+    ]
+    try:
+        for i in range(12):
+            if i % 2 and updates:
+                u = updates.pop(0)
+                dsA.update('db', dict(u))
+                dsB.update('db', dict(u))
+            img, changed = serial.render()
+            pImg, pChanged = pooled.render()
+            assert changed == pChanged, f'Render {i} changed should be {changed}'
+            assert not ImageChops.difference(img, pImg).getbbox(), f'Render {i} differs from serial render'
+            assert serial.damage == pooled.damage
+    finally:
+        pooled.close()
+
+
+def test_collection_processes_stopped():
+    import gc
+    from tinyDisplay.utility import dataset
+
+    def makeCollection():
+        ds = dataset({'db': {'artist': 'Sting'}})
+        col = collection(size=(80, 8), processes=1, dataset=ds)
+        c = canvas(size=(80, 8), placements=((text(value="db['artist']", dataset=ds), ), ), dataset=ds)
+        col.append(sequence=sequence(condition='True', dataset=ds, canvases=[(c, 10)], priority=10))
+        col.render()
+        return col, [p for p, conn in col._pool._workers], list(col._pool._blocks)
+
+    # Leaving the context stops the workers and frees their shared memory
+    col, processes, blocks = makeCollection()
+    with col:
+        col.render()
+    assert col._pool is None
+    assert not any(p.is_alive() for p in processes)
+    with pytest.raises(FileNotFoundError):
+        type(blocks[0])(name=blocks[0].name)
+
+    # As does garbage collecting the collection
+    col, processes, blocks = makeCollection()
+    del col
+    gc.collect()
+    assert not any(p.is_alive() for p in processes)
+    with pytest.raises(FileNotFoundError):
+        type(blocks[0])(name=blocks[0].name)
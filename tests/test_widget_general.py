@@ -10,6 +10,7 @@ Test of Image Widget for the tinyDisplay system
 import pytest
 from PIL import Image, ImageChops, ImageDraw
 
+from tinyDisplay.utility import dataset
 from tinyDisplay.render.widget import text, staticText, rectangle
 
 def test_image_placement():
@@ -95,3 +96,29 @@ def test_bad_four_tuple():
         w = rectangle( (0, 1, 2, 3, 4), fill='black', outline='white')
     assert str(ex.value) == \
         "xy must be an array of two tuples or four integers.  Instead received (0, 1, 2, 3, 4)"
+
+
+def test_dependency_tracking():
+    ds = dataset({'db': {'artist': 'Sting', 'title': 'Fields of Gold'}, 'sys': {'temp': 54.3}})
+    w = text(value='db[\'artist\']', dataset=ds)
+
+    evaluations = []
+    evaluate = w._eval
+    w._eval = lambda v: evaluations.append(v) or evaluate(v)
+
+    # Databases provided by the caller may be changed directly so they are always evaluated
+    w.render()
+    assert len(evaluations) == 1, 'Widget must evaluate an untracked database'
+
+    ds.update('db', {'title': 'Desert Rose'})
+    w.render()
+    evaluations.clear()
+
+    ds.update('db', {'title': 'Shape of My Heart'})
+    ds.update('sys', {'temp': 62.8})
+    img, changed = w.render()
+    assert not evaluations and not changed, 'Widget evaluated when none of its inputs changed'
+
+    ds.update('db', {'artist': 'Moby'})
+    img, changed = w.render()
+    assert len(evaluations) == 1 and changed and w.current == 'Moby', 'Widget did not re-evaluate after its input changed'
@@ -12,7 +12,12 @@ and multipage (e.g. >256 char) font files
 """
 
 from PIL import FontFile, Image, ImageFont
+from collections import OrderedDict, namedtuple
+from hashlib import sha1
+import mmap
+import os
 import pathlib
+import struct
 
 # Modify Pillow ImageFont to support BMFONTS with more than 256 characters
 
@@ -92,22 +97,201 @@ def _readGlyphData(fileName):
     return (lineHeight, glyphs)
 
 
+# Compiled font cache file layout
+#   header: magic, lineHeight, glyph count, strip width, strip height
+#   glyph table: one record per glyph (id, advance, bounding box, size, row within strip)
+#   strip: all glyph images stacked vertically in one image packed one bit per pixel
+_cacheMagic = b'TDFNT\x02'
+_cacheHeader = struct.Struct('<6sIIII')
+_cacheRecord = struct.Struct('<IiiiiiiIII')
+
+
+def _defaultCacheDir():
+    base = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(base) / 'tinyDisplay' / 'fonts'
+
+
+def _pageFiles(fileName):
+    """
+    Return the image files of a BMFONT's pages, resolved the same way _readGlyphData
+    opens them
+    """
+    retval = []
+    with open(fileName) as fp:
+        for s in fp:
+            if s[0:4].lower() == 'page':
+                fn = pathlib.Path(s.split()[2].split('=')[1].strip('"\''))
+                retval.append(fn if fn.exists() else pathlib.Path(fileName).parent / fn)
+            elif s[0:5].lower() == 'chars':
+                break
+    return retval
+
+
+def _cacheFileName(fileName, cacheDir):
+    """
+    Compute the name of the compiled cache file for a font.  The name changes
+    whenever the location, size or modification time of the font file or any of
+    its page images does.
+    """
+    p = pathlib.Path(fileName).resolve()
+    key = []
+    for f in [p] + _pageFiles(p):
+        f = f.resolve()
+        st = f.stat()
+        key.append(f'{f}|{st.st_size}|{st.st_mtime_ns}')
+    key = sha1('|'.join(key).encode('utf-8')).hexdigest()
+    return pathlib.Path(cacheDir) / f'{p.stem}-{key}.tdf'
+
+
+def _writeFontCache(cacheFile, lineHeight, glyphs):
+    width = max([g[2][2] for g in glyphs.values()] + [1])
+    strip = Image.new('1', (width, sum(g[2][3] for g in glyphs.values())))
+
+    records = []
+    y = 0
+    for ch, ((dx, dy), (l, t, r, b), (_, _, w, h), gImg) in glyphs.items():
+        strip.paste(gImg, (0, y))
+        records.append(_cacheRecord.pack(ch, dx, dy, l, t, r, b, w, h, y))
+        y += h
+
+    cacheFile = pathlib.Path(cacheFile)
+    cacheFile.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that a reader never sees a partial cache
+    tmp = cacheFile.with_name(f'{cacheFile.name}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(_cacheHeader.pack(_cacheMagic, lineHeight, len(records), strip.size[0], strip.size[1]))
+        f.write(b''.join(records))
+        f.write(strip.tobytes())
+    os.replace(tmp, cacheFile)
+
+
+def _readFontCache(cacheFile):
+    with open(cacheFile, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, lineHeight, count, width, height = _cacheHeader.unpack_from(mm)
+        if magic != _cacheMagic:
+            raise ValueError(f'{cacheFile} is not a compiled tinyDisplay font')
+
+        start = _cacheHeader.size
+        base = start + count * _cacheRecord.size
+        records = _cacheRecord.iter_unpack(mm[start:base])
+        strip = Image.frombytes('1', (width, height), mm[base:])
+
+    glyphs = {}
+    for ch, dx, dy, l, t, r, b, w, h, y in records:
+        glyphs[ch] = (dx, dy), (l, t, r, b), (0, 0, w, h), strip.crop((0, y, w, y + h))
+    return (lineHeight, glyphs)
+
+
+def _loadGlyphData(fileName, cacheDir=None):
+    """
+    Read glyph data from a BMFont file, using a compiled copy from cacheDir when one
+    exists for the current version of the file.  Set cacheDir to True to use the
+    default cache location.
+
+    :return: tuple of line height and dictionary of glyph data (see _readGlyphData)
+    :rtype: tuple(int, dict)
+    """
+    if not cacheDir:
+        return _readGlyphData(fileName)
+
+    cacheFile = _cacheFileName(fileName, _defaultCacheDir() if cacheDir is True else cacheDir)
+    try:
+        return _readFontCache(cacheFile)
+    except (OSError, ValueError, struct.error):
+        pass
+
+    lineHeight, glyphs = _readGlyphData(fileName)
+    try:
+        _writeFontCache(cacheFile, lineHeight, glyphs)
+    except OSError:
+        pass  # An unwritable cache only costs startup time
+    return (lineHeight, glyphs)
+
+
+_CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _lruCache():
+    '''
+    Bounded least recently used cache that keeps hit and miss counts
+    '''
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return value
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    @property
+    def info(self):
+        return _CacheInfo(self.hits, self.misses, self.maxsize, len(self._items))
+
+
 class tdImageFont(ImageFont.ImageFont):
-    def __init__(self, fileName, defaultChar=' ', *args, **kwargs):
+    def __init__(self, fileName, defaultChar=' ', cacheSize=256, cacheDir=None, *args, **kwargs):
         self._defaultChar = defaultChar
-        self.load(fileName, **kwargs)
+        self._sizeCache = _lruCache(cacheSize)
+        self._maskCache = _lruCache(cacheSize)
+        self.load(fileName, cacheDir=cacheDir, **kwargs)
 
-    def load(self, fileName, *args, **kwargs):
+    def load(self, fileName, cacheDir=None, *args, **kwargs):
         """
-        Load BMFONT file
+        Load BMFONT file.  If cacheDir is provided, a compiled copy of the font is
+        loaded from (or saved to) it so the font file and its pages only need to be
+        parsed once.
         """
-        self.lineHeight, self.tdGlyphs = _readGlyphData(fileName)
+        self.lineHeight, self.tdGlyphs = _loadGlyphData(fileName, cacheDir)
         self.xadvance = kwargs['xadvance'] if 'xadvance' in kwargs else None
+        self.clearCache()
+
+    def clearCache(self):
+        """
+        Discard all cached sizes and rendered strings
+        """
+        self._sizeCache.clear()
+        self._maskCache.clear()
+
+    @property
+    def cacheInfo(self):
+        """
+        Report hits, misses, maxsize and currsize of the rendered string cache
+        """
+        return self._maskCache.info
+
+    def _glyph(self, s):
+        return self.tdGlyphs.get(ord(s)) or self.tdGlyphs[ord(self._defaultChar)]
 
     def getsize(self, text, *args, **kwargs):
         """
         Get the size that the rendered text will require
         """
+        size = self._sizeCache.get(text)
+        if size:
+            return size
+
         xsize = xLineSize = 0
         ysize = yLineSize = 0
 
@@ -115,27 +299,123 @@ class tdImageFont(ImageFont.ImageFont):
             xLineSize = 0
             yLineSize = self.lineHeight
             for s in line:
-                i = ord(s) if ord(s) in self.tdGlyphs else ord(self._defaultChar)
-                xLineSize += self.xadvance if self.xadvance else self.tdGlyphs[i][0][0]
-                yLineSize = max(yLineSize, self.tdGlyphs[i][2][3])
+                g = self._glyph(s)
+                xLineSize += self.xadvance if self.xadvance else g[0][0]
+                yLineSize = max(yLineSize, g[2][3])
             xsize = max(xsize, xLineSize)
             ysize += yLineSize
-        return ((xsize, ysize))
+        return self._sizeCache.put(text, (xsize, ysize))
 
     def getmask(self, text, mode="", *args, **kwargs):
+        """
+        Render text into a mask.  Each rendered string is cached so repeated
+        values (clock digits, status labels) are only composed from glyphs once.
+        """
+        img = self._maskCache.get(text)
+        if not img:
+            img = self._maskCache.put(text, self._renderMask(text))
+        self.gmImage = img
+        return img.im
+
+    def _renderMask(self, text):
         img = Image.new("1", self.getsize(text))
         yp = 0
         for line in text.split('\n'):
-            ls = self.getsize(line)
             xp = 0
-            yp += ls[1]
+            yp += self.getsize(line)[1]
             for s in line:
-                i = ord(s) if ord(s) in self.tdGlyphs else ord(self._defaultChar)
-                img.paste(self.tdGlyphs[i][3], (xp + self.tdGlyphs[i][1][0], yp + self.tdGlyphs[i][1][1]))
-                xp += self.xadvance if self.xadvance else self.tdGlyphs[i][0][0]
+                g = self._glyph(s)
+                img.paste(g[3], (xp + g[1][0], yp + g[1][1]))
+                xp += self.xadvance if self.xadvance else g[0][0]
         img.load()
-        self.gmImage = img
-        return img.im
+        return img
+
+
+class tdAtlasFont(tdImageFont):
+    """
+    tdImageFont that packs all of its glyphs into a single bit-packed atlas.
+
+    Each glyph is stored pre-positioned within its advance cell as a run of
+    columns (one row of the transposed glyph per column) so that a line of text
+    is composed by joining the glyph runs and transposing the result once,
+    instead of pasting each glyph individually.
+
+    Glyphs that do not fit within their advance cell or the font's line height
+    cannot be placed this way.  Text that contains them is rendered by
+    tdImageFont instead.
+    """
+
+    def load(self, fileName, cacheDir=None, *args, **kwargs):
+        super().load(fileName, cacheDir, *args, **kwargs)
+        self._buildAtlas()
+
+    def _buildAtlas(self):
+        h = self.lineHeight
+        atlas = bytearray()
+        offsets = {}
+        for ch, g in self.tdGlyphs.items():
+            (dx, dy), (l, t, r, b), (_, _, w, gh), gImg = g
+            adv = self.xadvance if self.xadvance else dx
+
+            # Only glyphs that fit within their cell can be placed by joining columns
+            if l < 0 or r > adv or h + t < 0 or b > 0 or gh > h:
+                continue
+
+            cell = Image.new('1', (adv, h))
+            cell.paste(gImg, (l, h + t))
+            start = len(atlas)
+            atlas += cell.transpose(Image.TRANSPOSE).tobytes()
+            offsets[chr(ch)] = (start, len(atlas))
+
+        # Bytes needed to hold one column of a glyph
+        self._columnBytes = (h + 7) // 8
+        self._atlas = bytes(atlas)
+        self._atlasOffsets = offsets
+
+        view = memoryview(self._atlas)
+        self._atlasColumns = {k: view[s:e] for k, s, e in ((k, v[0], v[1]) for k, v in offsets.items())}
+
+    def _lineColumns(self, line):
+        cols = self._atlasColumns
+        try:
+            return [cols[c] for c in line]
+        except KeyError:
+            pass
+
+        # Substitute the default character for any glyph the font does not have
+        default = cols.get(self._defaultChar)
+        retval = []
+        for c in line:
+            if c in cols:
+                retval.append(cols[c])
+            elif ord(c) in self.tdGlyphs or default is None:
+                return None  # Glyph exists but is not in the atlas
+            else:
+                retval.append(default)
+        return retval
+
+    def _renderMask(self, text):
+        lines = text.split('\n')
+        columns = [self._lineColumns(line) for line in lines]
+        if None in columns:
+            return super()._renderMask(text)
+
+        h = self.lineHeight
+        images = []
+        for c in columns:
+            data = b''.join(c)
+            w = len(data) // self._columnBytes
+            images.append(Image.frombytes('1', (h, w), data).transpose(Image.TRANSPOSE) if w else None)
+
+        if len(images) == 1 and images[0]:
+            img = images[0]
+        else:
+            img = Image.new('1', self.getsize(text))
+            for i, li in enumerate(images):
+                if li:
+                    img.paste(li, (0, i * h))
+        img.load()
+        return img
 
 
 # Convert pydPiper's broken BMFONT format to Pillow's PIL format (or the BDF format)
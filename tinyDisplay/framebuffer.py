@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Packed framebuffers for display devices
+
+Each framebuffer converts rendered images into the memory layout that a display
+controller expects so that a driver can send the bytes without further conversion.
+The packed bytes are exposed as a memoryview and can optionally be backed by a
+memory mapped file (e.g. to stand in for a device during testing).
+
+.. versionadded:: 0.0.1
+"""
+import abc
+import mmap
+import pathlib
+import re
+from collections import namedtuple
+
+from PIL import Image
+
+# Reverses the order of the bits in a byte
+_reverseBits = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+# A run of changed bytes within one page, row or cell of a framebuffer
+change = namedtuple('change', 'unit start data')
+
+
+class framebuffer(metaclass=abc.ABCMeta):
+    '''
+    Base class for packed framebuffers
+
+    :param size: the size of the display in pixels (w, h)
+    :type size: (int, int)
+    :param file: optional path of a file to memory map as the framebuffer.  The file
+        is created (or resized) to the length of the framebuffer
+    :type file: str or pathlib.Path
+    '''
+
+    # Report changes as whole units rather than runs of bytes within a unit
+    _wholeUnits = False
+
+    def __init__(self, size=None, file=None):
+        assert size, 'You must provide the size of the display'
+        self.size = tuple(size)
+        self._file = None
+        length = self._length()
+
+        if file:
+            self._file = open(file, 'r+b' if pathlib.Path(file).exists() else 'w+b')
+            self._file.truncate(length)
+            self._file.flush()
+            self._buf = mmap.mmap(self._file.fileno(), length)
+        else:
+            self._buf = bytearray(length)
+        self.buffer = memoryview(self._buf)
+        self._sent = False
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} size{self.size} {len(self)} bytes at 0x{id(self):x}>'
+
+    @abc.abstractmethod
+    def _length(self):
+        '''
+        Return the length of the framebuffer in bytes
+        '''
+        pass    # pragma: no cover
+
+    @abc.abstractmethod
+    def _pack(self, img):
+        '''
+        Return the image packed into the device layout as bytes
+        '''
+        pass    # pragma: no cover
+
+    def update(self, img):
+        '''
+        Pack img into the framebuffer
+
+        :param img: the image to display.  Must be the size of the framebuffer
+        :type img: PIL.Image
+        :return: the framebuffer's memoryview
+        '''
+        assert img.size == self.size, f'Image size {img.size} does not match framebuffer size {self.size}'
+        self.buffer[:] = self._pack(img)
+        return self.buffer
+
+    @abc.abstractmethod
+    def _units(self):
+        '''
+        Return the size in bytes of the units (pages, rows or cells) that the device
+        addresses separately.  Changes never span more than one unit.
+        '''
+        pass    # pragma: no cover
+
+    def diff(self, img, gap=4):
+        '''
+        Pack img into the framebuffer and return the bytes that changed
+
+        :param img: the image to display.  Must be the size of the framebuffer
+        :type img: PIL.Image
+        :param gap: the number of unchanged bytes between two changes that is still
+            cheaper to resend than to address separately
+        :type gap: int
+        :return: a list of changes (unit, start, data) where data replaces the bytes of
+            unit starting at start.  The first diff returns the whole framebuffer
+        :rtype: [change]
+        '''
+        assert img.size == self.size, f'Image size {img.size} does not match framebuffer size {self.size}'
+        new = self._pack(img)
+        full = not self._sent
+        self._sent = True
+        if not full and new == self.buffer:
+            return []
+
+        unit = self._units()
+        runs = re.compile(b'[^\\x00]+(?:\\x00{0,%d}[^\\x00]+)*' % gap)
+        changes = []
+        for u, offset in enumerate(range(0, len(new), unit)):
+            n = new[offset: offset + unit]
+            if full:
+                changes.append(change(u, 0, n))
+                continue
+
+            # XOR the unit as a single integer to find whether (and where) it changed
+            x = int.from_bytes(self.buffer[offset: offset + unit], 'big') ^ int.from_bytes(n, 'big')
+            if not x:
+                continue
+            if self._wholeUnits:
+                changes.append(change(u, 0, n))
+                continue
+            first = unit - (x.bit_length() + 7) // 8
+            last = unit - 1 - ((x & -x).bit_length() - 1) // 8
+            if last - first < gap + 2:
+                changes.append(change(u, first, n[first:last + 1]))
+                continue
+            for m in runs.finditer(x.to_bytes(unit, 'big'), first, last + 1):
+                changes.append(change(u, m.start(), n[m.start():m.end()]))
+
+        self.buffer[:] = new
+        return changes
+
+    def close(self):
+        self.buffer.release()
+        if self._file:
+            self._buf.close()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ssd1306(framebuffer):
+    '''
+    Monochrome page layout used by the SSD1306, SH1106 and similar controllers.  The
+    display is divided into pages of eight rows.  Each byte holds a column of one page
+    with the top pixel in the least significant bit and pages are stored in order.
+    '''
+
+    def _length(self):
+        return self.size[0] * ((self.size[1] + 7) // 8)
+
+    def _units(self):
+        return self.size[0]
+
+    def _pack(self, img):
+        pages = (self.size[1] + 7) // 8
+
+        # Transposing turns each column into a row which packs as one byte per page,
+        # most significant bit first.  Reverse the bits then regroup the bytes by page
+        img = img if img.mode == '1' else img.convert('1')
+        data = img.transpose(Image.TRANSPOSE).tobytes().translate(_reverseBits)
+        return b''.join(data[p::pages] for p in range(pages))
+
+
+class ssd1322(framebuffer):
+    '''
+    4-bit greyscale layout used by the SSD1322 and SSD1362.  Each byte holds two
+    horizontally adjacent pixels with the leftmost pixel in the high nibble.  Rows are
+    stored in order.  The width of the display must be even.
+    '''
+
+    # Keep the top four bits of a greyscale value in the high or low nibble
+    _high = bytes(i & 0xf0 for i in range(256))
+    _low = bytes(i >> 4 for i in range(256))
+
+    def __init__(self, size=None, *args, **kwargs):
+        assert size and not size[0] % 2, 'The width of an ssd1322 display must be even'
+        super().__init__(size, *args, **kwargs)
+
+    def _length(self):
+        return self.size[0] * self.size[1] // 2
+
+    def _units(self):
+        return self.size[0] // 2
+
+    def _pack(self, img):
+        # Greyscale images are packed directly.  Others are converted first
+        data = (img if img.mode == 'L' else img.convert('L')).tobytes()
+
+        # Combine the nibbles for every pair of pixels with a single integer OR
+        high = int.from_bytes(data[0::2].translate(self._high), 'big')
+        low = int.from_bytes(data[1::2].translate(self._low), 'big')
+        return (high | low).to_bytes(len(self), 'big')
+
+
+class hd44780(framebuffer):
+    '''
+    Character cell layout for HD44780 style displays driven with custom characters.
+    The display is divided into cells of cellSize pixels separated by spacing pixels.
+    Each cell is stored as one byte per row with the rightmost pixel in the least
+    significant bit.  Cells are stored left to right, top to bottom.
+
+    :param cellSize: the size of each character cell in pixels
+    :param spacing: the number of pixels between cells horizontally and vertically
+    '''
+
+    def __init__(self, size=None, cellSize=(5, 8), spacing=(0, 0), *args, **kwargs):
+        assert cellSize[0] <= 8, 'Cells can be at most eight pixels wide'
+        self.cellSize = tuple(cellSize)
+        self.spacing = tuple(spacing)
+        self.cells = (
+            (size[0] + spacing[0]) // (cellSize[0] + spacing[0]),
+            (size[1] + spacing[1]) // (cellSize[1] + spacing[1]),
+        )
+        super().__init__(size, *args, **kwargs)
+
+    def _length(self):
+        return self.cells[0] * self.cells[1] * self.cellSize[1]
+
+    # Custom characters are always sent whole
+    _wholeUnits = True
+
+    def _units(self):
+        return self.cellSize[1]
+
+    def _pack(self, img):
+        img = img if img.mode == '1' else img.convert('1')
+        cols, rows = self.cells
+        cw, ch = self.cellSize
+        sx, sy = self.spacing[0] + cw, self.spacing[1] + ch
+
+        # Place every column of cells in its own byte wide slot, right aligned, and every
+        # row of cells directly beneath the last so that each row of pixels in a cell packs
+        # into one byte
+        slots = Image.new('1', (cols * 8, rows * ch))
+        for r in range(rows):
+            for c in range(cols):
+                slots.paste(img.crop((c * sx, r * sy, c * sx + cw, r * sy + ch)), (c * 8 + 8 - cw, r * ch))
+        data = slots.tobytes()
+
+        # Gather the bytes of each cell
+        return b''.join(
+            data[r * ch * cols + c: (r + 1) * ch * cols: cols]
+            for r in range(rows) for c in range(cols)
+        )
+
+
+class rgb565(framebuffer):
+    '''
+    16-bit colour layout used by the ST7735, ST7789, ILI9341 and similar controllers.
+    Each pixel is stored as two bytes, most significant byte first, holding five bits
+    of red, six of green and five of blue.  Rows are stored in order.
+    '''
+
+    # Place the top bits of each channel in the high or low byte of the pixel
+    _red = bytes(i & 0xf8 for i in range(256))
+    _greenHigh = bytes(i >> 5 for i in range(256))
+    _greenLow = bytes((i & 0x1c) << 3 for i in range(256))
+    _blue = bytes(i >> 3 for i in range(256))
+
+    def _length(self):
+        return self.size[0] * self.size[1] * 2
+
+    def _units(self):
+        return self.size[0] * 2
+
+    def _pack(self, img):
+        r, g, b = (img if img.mode == 'RGB' else img.convert('RGB')).split()
+        r, g, b = r.tobytes(), g.tobytes(), b.tobytes()
+        n = len(r)
+
+        high = int.from_bytes(r.translate(self._red), 'big') | int.from_bytes(g.translate(self._greenHigh), 'big')
+        low = int.from_bytes(g.translate(self._greenLow), 'big') | int.from_bytes(b.translate(self._blue), 'big')
+
+        data = bytearray(n * 2)
+        data[0::2] = high.to_bytes(n, 'big')
+        data[1::2] = low.to_bytes(n, 'big')
+        return data
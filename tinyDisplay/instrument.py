@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Opt-in instrumentation of the render tree
+
+A profiler attaches to a widget, canvas, sequence or collection and to everything
+rendered beneath it, timing each render, statement evaluation and paste.  Objects
+that are not attached run their normal, untimed methods.
+
+.. versionadded:: 0.0.1
+"""
+import json
+import os
+import time
+from collections import deque, namedtuple
+from threading import get_ident, local
+
+from tinyDisplay.render.sequence import _renderTree
+
+renderStats = namedtuple('renderStats', 'name type renders changed changedRatio renderTime selfTime evalTime pasteTime')
+
+
+class profiler():
+    '''
+    Records per-object render counts, render time (inclusive and self), evaluation
+    time, paste time and the ratio of renders that changed the image.
+
+    :param maxEvents: number of trace events to retain for trace()
+    '''
+
+    # Methods timed on each attached object and the category their time is recorded under
+    _methods = (
+        ('render', 'render'),
+        ('_eval', 'eval'),
+        ('_place', 'paste'),
+        ('_repaint', 'paste'),
+    )
+
+    def __init__(self, maxEvents=100000):
+        self.clock = time.perf_counter
+        self._epoch = self.clock()
+        self._events = deque(maxlen=maxEvents)
+        self._stats = {}
+        self._attached = {}
+        self._overrides = {}
+        self._local = local()
+
+    def attach(self, root):
+        '''
+        Instrument root and every object rendered beneath it
+        '''
+        for obj in _renderTree(root):
+            if id(obj) in self._attached:
+                continue
+            self._attached[id(obj)] = obj
+            self._stats[id(obj)] = {'name': self._name(obj), 'type': type(obj).__name__, 'renders': 0, 'changed': 0, 'render': 0, 'self': 0, 'eval': 0, 'paste': 0}
+
+            # Remember any methods the instance already overrides so detach can restore them
+            self._overrides[id(obj)] = {m: obj.__dict__[m] for m, cat in self._methods if m in obj.__dict__}
+            for m, cat in self._methods:
+                f = getattr(obj, m, None)
+                if f is not None:
+                    setattr(obj, m, self._wrap(obj, f, cat))
+        return self
+
+    def detach(self):
+        '''
+        Restore the original methods of every attached object
+        '''
+        for key, obj in self._attached.items():
+            overrides = self._overrides.get(key, {})
+            for m, cat in self._methods:
+                if m in overrides:
+                    obj.__dict__[m] = overrides[m]
+                else:
+                    obj.__dict__.pop(m, None)
+        self._attached = {}
+        self._overrides = {}
+
+    def reset(self):
+        self._events.clear()
+        self._epoch = self.clock()
+        for s in self._stats.values():
+            s.update({'renders': 0, 'changed': 0, 'render': 0, 'self': 0, 'eval': 0, 'paste': 0})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    @staticmethod
+    def _name(obj):
+        n = getattr(obj, 'name', None)
+        return n if n else f'{type(obj).__name__}@{id(obj):x}'
+
+    def _wrap(self, obj, f, category):
+        stats = self._stats[id(obj)]
+        clock = self.clock
+        threadLocal = self._local
+        name = stats['name']
+
+        def wrapper(*args, **kwargs):
+            # Each entry on the stack accumulates the time spent in the renders it contains
+            # so that self time can be separated from inclusive time
+            stack = getattr(threadLocal, 'stack', None)
+            if stack is None:
+                stack = threadLocal.stack = []
+            stack.append(0)
+            start = clock()
+            try:
+                retval = f(*args, **kwargs)
+            finally:
+                duration = clock() - start
+                children = stack.pop()
+                if stack and category == 'render':
+                    stack[-1] += duration
+                stats[category] += duration
+                self._events.append((name, category, start, duration, get_ident()))
+
+            if category == 'render':
+                stats['renders'] += 1
+                stats['self'] += duration - children
+                if retval[1]:
+                    stats['changed'] += 1
+            return retval
+
+        return wrapper
+
+    def stats(self):
+        '''
+        Return the statistics for every attached object sorted by self time with the
+        most expensive first
+
+        :rtype: [renderStats]
+        '''
+        retval = []
+        for s in self._stats.values():
+            r = s['renders']
+            retval.append(renderStats(s['name'], s['type'], r, s['changed'], s['changed'] / r if r else 0,
+                s['render'], s['self'], s['eval'], s['paste']))
+        return sorted(retval, key=lambda x: x.selfTime, reverse=True)
+
+    def summary(self):
+        '''
+        Return the statistics formatted as a text table.  Times are in milliseconds.
+        '''
+        header = f'{"name":<24} {"type":<12} {"renders":>8} {"changed":>8} {"render":>10} {"self":>10} {"eval":>10} {"paste":>10}'
+        lines = [header, '-' * len(header)]
+        for s in self.stats():
+            lines.append(f'{s.name[:24]:<24} {s.type[:12]:<12} {s.renders:>8} {s.changedRatio:>8.1%} '
+                f'{s.renderTime*1000:>10.2f} {s.selfTime*1000:>10.2f} {s.evalTime*1000:>10.2f} {s.pasteTime*1000:>10.2f}')
+        return '\n'.join(lines)
+
+    def trace(self, fileName=None):
+        '''
+        Return the recorded events in Chrome trace event format (viewable in
+        chrome://tracing or Perfetto).  If fileName is provided the trace is also
+        written to it.
+        '''
+        pid = os.getpid()
+        events = [
+            {'name': name, 'cat': cat, 'ph': 'X', 'ts': (start - self._epoch) * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': tid}
+            for name, cat, start, duration, tid in self._events
+        ]
+        retval = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if fileName:
+            with open(fileName, 'w') as fn:
+                json.dump(retval, fn)
+        return retval
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2020 Ron Ritchey and contributors
+# See License.rst for details
+
+"""
+Record rendered frames to a file
+
+Frames are written as they arrive so that recordings of any length can be made
+without holding the frames in memory.  Supported formats are animated GIF,
+animated PNG (APNG) and a raw frame file that can be read back with readRaw.
+
+.. versionadded:: 0.0.1
+"""
+import struct
+import zlib
+from fractions import Fraction
+
+from PIL import Image, GifImagePlugin
+
+_rawMagic = b'TDRAW\x01'
+_rawHeader = '<6s4sIId'     # magic, mode, width, height, fps
+_rawRecord = '<I'           # number of consecutive frames the image was displayed for
+
+
+class recorder():
+    '''
+    Write frames to fileName as they are rendered
+
+    :param fileName: the file to record to
+    :param fps: the rate that frames are provided at
+    :type fps: float
+    :param format: 'gif', 'apng' or 'raw'.  If not provided it is determined from the
+        extension of fileName ('.gif', '.png' or '.apng', anything else is raw)
+    :type format: str
+    :param dedupe: combine identical consecutive frames into one longer frame
+    :type dedupe: bool
+    :param loop: number of times an animated GIF or PNG should play (0 is forever)
+    :type loop: int
+    '''
+
+    def __init__(self, fileName=None, fps=30, format=None, dedupe=True, loop=0):
+        assert fileName, 'You must provide a file to record to'
+        ext = str(fileName).lower().rsplit('.', 1)[-1]
+        self.format = (format or {'gif': 'gif', 'png': 'apng', 'apng': 'apng'}.get(ext, 'raw')).lower()
+        assert self.format in ('gif', 'apng', 'raw'), f'{format} is not a supported recording format'
+
+        self.fps = fps
+        self._dedupe = dedupe
+        self._loop = loop
+        self._fp = open(fileName, 'wb')
+        self._writer = {'gif': _gifWriter, 'apng': _apngWriter, 'raw': _rawWriter}[self.format](self._fp, fps, loop)
+
+        self.frames = 0         # Frames received
+        self.distinct = 0       # Frames that differed from the frame before them
+        self._pending = None    # Most recent distinct frame (and its bytes) not yet written
+        self._count = 0         # Number of frames the pending frame has been displayed for
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def distinctRate(self):
+        '''
+        Number of distinct frames per second of recorded time
+        '''
+        return self.distinct * self.fps / self.frames if self.frames else 0
+
+    def write(self, img):
+        '''
+        Add img as the next frame of the recording
+
+        :return: True if img differed from the previous frame
+        :rtype: bool
+        '''
+        self.frames += 1
+        if self._pending:
+            pImg, pData = self._pending
+            if img is pImg or (img.size == pImg.size and img.mode == pImg.mode and img.tobytes() == pData):
+                if self._dedupe:
+                    self._count += 1
+                else:
+                    self._flush()
+                    self._pending = (pImg, pData)
+                    self._count = 1
+                return False
+            self._flush()
+
+        self.distinct += 1
+        self._pending = (img, img.tobytes())
+        self._count = 1
+        return True
+
+    def wrap(self, function):
+        '''
+        Return a function that calls function (e.g. a collection's render), records the
+        image it returns and then returns its result.  Useful as the function for animate.
+        '''
+        def _record(*args, **kwargs):
+            retval = function(*args, **kwargs)
+            self.write(retval[0])
+            return retval
+        return _record
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write(self._pending[0], self._count)
+            self._pending = None
+            self._count = 0
+
+    def close(self):
+        if self._fp:
+            self._flush()
+            self._writer.close()
+            self._fp.close()
+            self._fp = None
+
+
+class _gifWriter():
+    '''
+    Streams frames to an animated GIF.  Every frame uses the same global palette so
+    frames can be written as they arrive.
+    '''
+    def __init__(self, fp, fps, loop):
+        self._fp = fp
+        self._loop = loop
+        self._interval = 100 / fps      # GIF frame durations are in hundredths of a second
+        self._elapsed = 0
+        self._written = 0
+        self._header = False
+
+    @staticmethod
+    def _normalize(img):
+        # Greyscale keeps its own palette.  Colour is mapped to the web palette so that
+        # every frame shares the same one
+        return img.convert('L') if img.mode in ('1', 'L') else img.convert('RGB').convert('P', palette=Image.WEB)
+
+    def write(self, img, count):
+        img = self._normalize(img)
+        if not self._header:
+            self._header = True
+            header, used = GifImagePlugin.getheader(img.copy(), info={'loop': self._loop})
+            self._fp.write(b''.join(header))
+
+        # Round the end of each frame to the GIF's resolution so that rounding errors don't accumulate
+        self._elapsed += count
+        end = round(self._elapsed * self._interval)
+        duration = end - self._written
+        self._written = end
+
+        # Frame delays can't exceed 65535 hundredths of a second so long holds are spread across repeated frames
+        while True:
+            d = min(duration, 65535)
+            duration -= d
+            self._fp.write(b''.join(GifImagePlugin.getdata(img, duration=d * 10)))
+            if duration <= 0:
+                break
+
+    def close(self):
+        if self._header:
+            self._fp.write(b';')
+
+
+class _apngWriter():
+    '''
+    Streams frames to an animated PNG.  The number of frames is not known until the
+    recording ends so it is written when the file is closed.
+    '''
+
+    # PNG colour type and bit depth for each image mode
+    _types = {'1': (0, 1), 'L': (0, 8), 'RGB': (2, 8)}
+
+    def __init__(self, fp, fps, loop):
+        self._fp = fp
+        self._loop = loop
+        self._delay = Fraction(1 / fps).limit_denominator(65535) if fps != int(fps) or fps > 65535 else Fraction(1, int(fps))
+        self._sequence = 0
+        self._frames = 0
+        self._actl = None
+
+    def _chunk(self, kind, data):
+        self._fp.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+
+    def write(self, img, count):
+        if img.mode not in self._types:
+            img = img.convert('RGB')
+        if not self._frames:
+            self._mode, self._size = img.mode, img.size
+            colorType, depth = self._types[img.mode]
+            self._fp.write(b'\x89PNG\r\n\x1a\n')
+            self._chunk(b'IHDR', struct.pack('>IIBBBBB', img.size[0], img.size[1], depth, colorType, 0, 0, 0))
+            self._actl = self._fp.tell()
+            self._chunk(b'acTL', struct.pack('>II', 0, self._loop))
+        elif img.mode != self._mode or img.size != self._size:
+            img = img.convert(self._mode).crop((0, 0, self._size[0], self._size[1]))
+
+        # Frame delays can't exceed 65535 units so long pauses are spread across repeated frames
+        delay = self._delay * count
+        while delay > 0:
+            d = min(delay, Fraction(65535, self._delay.denominator))
+            delay -= d
+            self._frame(img, d)
+
+    def _frame(self, img, delay):
+        self._chunk(b'fcTL', struct.pack('>IIIIIHHBB', self._sequence, img.size[0], img.size[1], 0, 0,
+            delay.numerator, delay.denominator, 0, 0))
+        self._sequence += 1
+
+        # Every row is stored with a filter type of none
+        data = img.tobytes()
+        stride = len(data) // img.size[1] if img.size[1] else 0
+        data = zlib.compress(b''.join(b'\x00' + data[i:i + stride] for i in range(0, len(data), stride)))
+        if not self._frames:
+            self._chunk(b'IDAT', data)
+        else:
+            self._chunk(b'fdAT', struct.pack('>I', self._sequence) + data)
+            self._sequence += 1
+        self._frames += 1
+
+    def close(self):
+        if not self._frames:
+            return
+        self._chunk(b'IEND', b'')
+        self._fp.seek(self._actl)
+        self._chunk(b'acTL', struct.pack('>II', self._frames, self._loop))
+
+
+class _rawWriter():
+    '''
+    Writes each frame as a count followed by the image's bytes
+    '''
+    def __init__(self, fp, fps, loop):
+        self._fp = fp
+        self._fps = fps
+        self._header = None
+
+    def write(self, img, count):
+        if not self._header:
+            self._header = (img.mode, img.size)
+            self._fp.write(struct.pack(_rawHeader, _rawMagic, img.mode.encode(), img.size[0], img.size[1], self._fps))
+        elif (img.mode, img.size) != self._header:
+            raise ValueError(f'Raw recordings require every frame to be {self._header[0]} {self._header[1]}.  Received {img.mode} {img.size}')
+        self._fp.write(struct.pack(_rawRecord, count))
+        self._fp.write(img.tobytes())
+
+    def close(self):
+        pass
+
+
+def readRaw(fileName):
+    '''
+    Read a raw recording
+
+    :return: the recording's fps and a generator of (image, count) where count is the
+        number of consecutive frames that image was displayed for
+    :rtype: (float, generator)
+    '''
+    fp = open(fileName, 'rb')
+    magic, mode, w, h, fps = struct.unpack(_rawHeader, fp.read(struct.calcsize(_rawHeader)))
+    if magic != _rawMagic:
+        fp.close()
+        raise ValueError(f'{fileName} is not a raw tinyDisplay recording')
+    mode = mode.rstrip(b'\x00').decode()
+    length = len(Image.new(mode, (w, h)).tobytes())
+
+    def _frames():
+        with fp:
+            while True:
+                rec = fp.read(struct.calcsize(_rawRecord))
+                if not rec:
+                    return
+                count, = struct.unpack(_rawRecord, rec)
+                yield (Image.frombytes(mode, (w, h), fp.read(length)), count)
+
+    return (fps, _frames())
@@ -11,14 +11,16 @@ Manager to control the animation of the tinyDisplay system
 import yaml
 import re
 import os
+import json
+import time
 import pathlib
 from PIL import ImageFont
 from inspect import isclass, getfullargspec
 
-from tinyDisplay.utility import dataset as Dataset
+from tinyDisplay.utility import dataset as Dataset, virtualClock
 from tinyDisplay.render.sequence import sequence, collection
 import tinyDisplay.render.widget as widget
-from tinyDisplay.font import tdImageFont
+from tinyDisplay.font import tdImageFont, tdAtlasFont
 
 
 class Loader(yaml.SafeLoader):
@@ -37,18 +39,29 @@ Loader.add_constructor('!include', Loader.include)
 
 class manager():
 
-    def __init__(self, pageFile=None, pydPageFile=None, dataset=None, displaySize=None, defaultCanvas=None):
+    def __init__(self, pageFile=None, pydPageFile=None, dataset=None, displaySize=None, defaultCanvas=None, fontCache=None, mode='1', clock=None):
         self.size = displaySize if displaySize else (0, 0)
+        self._mode = mode  # PIL mode ('1', 'L' or 'RGB') that the display is rendered in
         self._defaultCanvas = defaultCanvas
-        self._dataset = Dataset(dataset) if dataset and type(dataset) is dict else dataset if dataset else Dataset()
+        self._fontCache = fontCache  # Directory to hold compiled BMFONTs (True for the default location)
+        if isinstance(dataset, Dataset):
+            # Updates must be timestamped on the same clock that the sequences are timed against
+            assert clock is None or dataset._clock is clock, 'The dataset must use the same clock as the manager'
+            clock = dataset._clock
+        self._clock = clock or time.time  # Time source for the dataset and sequences (e.g. a virtualClock)
+        self._dataset = Dataset(dataset, clock=self._clock) if dataset and type(dataset) is dict else dataset if dataset else Dataset(clock=self._clock)
 
         self._fonts = {}
         self._widgets = {}
         self._canvases = {}
         self._sequences = {}
+        self._collection = None
 
-        # Load valid parameters for each widget type
-        self._wParams = {k: getfullargspec(v.__init__)[0][1:] for k, v in widget.__dict__.items() if isclass(v) and issubclass(v, widget.widget) and k != 'widget'}
+        # Load valid parameters for each widget type including those inherited from its base classes
+        self._wParams = {
+            k: list(dict.fromkeys(a for c in v.__mro__ if issubclass(c, widget.widget) for a in getfullargspec(c.__init__)[0][1:]))
+            for k, v in widget.__dict__.items() if isclass(v) and issubclass(v, widget.widget) and k != 'widget'
+        }
 
         if pageFile:
             self._loadPageFile(pageFile)
@@ -88,8 +101,81 @@ class manager():
 
         self._transform()
 
+    def render(self, force=False):
+        '''
+        Render the page file's sequences.  The collection is created on the first render.
+
+        :return: the display's image and whether it changed since the last render
+        :rtype: (PIL.Image, bool)
+        '''
+        if not self._collection:
+            self._createCollection()
+        return self._collection.render(force)
+
+    def fastForward(self, duration, fps=30, timeline=None, callback=None):
+        '''
+        Render duration seconds of display output as quickly as possible.  The manager
+        must have been created with a virtualClock which is advanced 1/fps seconds after
+        each frame so that sequence timing is the same as when animated at fps.
+
+        :param duration: the number of seconds of display time to render
+        :type duration: float
+        :param fps: the frame rate being simulated
+        :type fps: float
+        :param timeline: dataset updates to apply while rendering.  Either a list of
+            (time, dbName, update) where time is in seconds from the start, or the name of a
+            file written by dataset.save
+        :type timeline: list or str
+        :param callback: called with the image of every frame (e.g. a recorder's write)
+        :type callback: function
+        :return: the number of frames rendered, how many changed, the seconds taken and
+            the speed relative to real time
+        :rtype: dict
+        '''
+        assert isinstance(self._clock, virtualClock), 'fastForward requires a manager created with a virtualClock'
+        events = self._readTimeline(timeline) if isinstance(timeline, (str, pathlib.PurePath)) else \
+            sorted(timeline or [], key=lambda e: e[0])
+
+        start = self._clock()
+        frames = int(round(duration * fps))
+        changed = 0
+        e = 0
+        wallStart = time.perf_counter()
+        for i in range(frames):
+            # Apply the updates that became due since the last frame
+            now = i / fps
+            while e < len(events) and events[e][0] <= now:
+                self._dataset.update(events[e][1], dict(events[e][2]))
+                e += 1
+
+            img, c = self.render()
+            changed += 1 if c else 0
+            if callback:
+                callback(img)
+
+            # Set rather than add to the clock so rounding errors don't accumulate
+            self._clock.set(start + (i + 1) / fps)
+
+        elapsed = time.perf_counter() - wallStart
+        return {'frames': frames, 'changed': changed, 'elapsed': elapsed, 'speedup': frames / fps / elapsed if elapsed else 0}
+
+    @staticmethod
+    def _readTimeline(filename):
+        '''
+        Convert a file written by dataset.save into a list of (time, dbName, update).  The
+        starting position is applied at time zero.
+        '''
+        events = []
+        with open(filename) as fn:
+            lines = [line for line in fn if line.strip() and not line.startswith('#')]
+        for i, line in enumerate(lines):
+            for db, update in json.loads(line).items():
+                t = update.pop('__timestamp__', 0)
+                events.append((t if i else 0, db, update))
+        return sorted(events, key=lambda e: e[0])
+
     def _createCollection(self):
-        self._collection = collection(size=self.size, defaultCanvas=self._defaultCanvas)
+        self._collection = collection(size=self.size, defaultCanvas=self._defaultCanvas, dataset=self._dataset, mode=self._mode, clock=self._clock)
         for name, seqConfig in self._pf['SEQUENCES'].items():
             seq = self._createSequence(name, seqConfig)
             self._collection.append(sequence=seq, placement=seqConfig.get('placement'), just=seqConfig.get('just'))
@@ -99,7 +185,7 @@ class manager():
         if name in self._sequences:
             return self._sequences[name]
 
-        seq = sequence(name=name, condition=cfg.get('condition'), minDuration=cfg.get('minDuration'), priority=cfg.get('priority'), coolingPeriod=cfg.get('coolingPeriod'), dataset=self._dataset, defaultCanvas=self._defaultCanvas)
+        seq = sequence(name=name, condition=cfg.get('condition'), minDuration=cfg.get('minDuration'), priority=cfg.get('priority'), coolingPeriod=cfg.get('coolingPeriod'), dataset=self._dataset, defaultCanvas=self._defaultCanvas, clock=self._clock)
 
         for canvas in cfg['canvases']:
             c = self._createCanvas(canvas['name'])
@@ -122,10 +208,10 @@ class manager():
             for pi in cfg['placements']:
                 wname, p, a = pi if len(pi) == 3 else (pi[0], pi[1], 'lt')
                 w = self._createWidget(wname, self._pf['WIDGETS'][wname])
-                placements.append((p, a, w))
+                placements.append((w, p, a))
 
             # name=None, size=None, placements=None
-            c = widget.canvas(name, size=cfg['size'], placements=placements)
+            c = widget.canvas(name=name, size=cfg['size'], placements=placements, mode=self._mode)
             if 'effect' in cfg:
                 c = self._addEffect(c, name, cfg)
         else:
@@ -163,7 +249,7 @@ class manager():
         cfg['dataset'] = self._dataset
 
         kwargs = {k: v for k, v in cfg.items() if k in self._wParams[cfg['type']]}
-        w = widget.__dict__[cfg['type']](**kwargs)
+        w = widget.__dict__[cfg['type']](mode=self._mode, **kwargs)
 
         if 'effect' in cfg:
             w = self._addEffect(w, name, cfg)
@@ -210,12 +296,12 @@ class manager():
             cfg = self._pf['FONTS'][name]
             if cfg['type'] == 'BMFONT':
                 p = self._findFile(cfg['file'], 'fonts')
-                fnt = tdImageFont(p)
+                fnt = tdAtlasFont(p, cacheDir=self._fontCache) if cfg.get('atlas') else tdImageFont(p, cacheDir=self._fontCache)
             elif cfg['type'].lower() == 'truetype':
                 fnt = ImageFont.truetype(cfg['file'], int(cfg['size']))
         else:
             # Assume that name is a filename instead of a reference to a font description in FONTS
-            fnt = tdImageFont(self._findFile(name, 'fonts'))
+            fnt = tdImageFont(self._findFile(name, 'fonts'), cacheDir=self._fontCache)
         if fnt:
             self._fonts[name] = fnt
         return fnt
@@ -10,20 +10,68 @@ Sequence enables a series of canvases to be displayed
 import time
 import bisect
 import logging
+import weakref
+from collections import deque
 from operator import itemgetter
+from threading import Thread, Condition
 from PIL import Image
 from tinyDisplay.utility import dataset as Dataset
-from tinyDisplay.render.widget import image, canvas
+from tinyDisplay.render.widget import widget, image, canvas, marquee, scroll, staticWidget
+
+
+class _placement(staticWidget):
+    '''
+    Holds the most recent image rendered by a sequence so that it can be placed
+    on a collection's canvas without copying it
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._changed = False
+        self._damage = []
+
+    def set(self, img, changed, damage):
+        self.image = img
+        self._changed = changed
+        self._damage = damage
+
+    def _render(self, force=False, *args, **kwargs):
+        changed = self._changed or force
+        self._changed = False
+        self.damage = self._damage if changed and not force else None
+        return (self.image, changed)
 
 
 class collection():
 
-    def __init__(self, name=None, size=(0, 0), sequences=None, defaultCanvas=None):
+    def __init__(self, name=None, size=(0, 0), sequences=None, defaultCanvas=None, processes=0, dataset=None, mode='1', clock=None):
+        """
+        Create a new collection
+
+        :param processes: if greater than zero, render the collection's sequences in this
+            many worker processes.  Each sequence is rendered by one worker which receives the
+            dataset's updates before every render and returns its images through shared memory.
+            Requires the fork start method.  The workers are stopped by close, when the
+            collection is used as a context manager, or when it is garbage collected
+        :type processes: int
+        :param dataset: the dataset shared by the sequences.  Defaults to the dataset of the
+            first sequence
+        :type dataset: tinyDisplay.utility.dataset
+        :param mode: the PIL mode of the collection's images ('1', 'L' or 'RGB')
+        :type mode: str
+        :param clock: function returning the current time in seconds used to time minimum
+            durations and cooling periods.  Defaults to the dataset's clock or time.time
+        :type clock: function
+        """
         self._sequences = sequences if sequences else []
         self.size = size
+        self.mode = mode
+        self._processes = processes
+        self._dataset = dataset
+        self._clock = clock or (dataset._clock if dataset else time.time)
+        self._pool = None
 
         if not defaultCanvas:
-            defaultCanvas = image(image=Image.new('1', size))  # Set an empty image if no defaultCanvas provided
+            defaultCanvas = image(image=Image.new(mode, size), mode=mode)  # Set an empty image if no defaultCanvas provided
         self._defaultCanvas = defaultCanvas
 
         self._priorities = []
@@ -35,6 +83,12 @@ class collection():
         self._minTimer = {}
         self._inUse = set()
         self._cooling = {}
+        self.damage = []
+
+        # The canvas and placements are reused from render to render
+        self._canvas = canvas(size=self.size, mode=mode)
+        self._placements = {}
+        self._defaultInUse = False
 
     def append(self, sequence=None, placement=None, just=None):
         placement = placement if placement else (0, 0)
@@ -44,9 +98,12 @@ class collection():
         self._priorities.insert(pos, sequence._priority)
         self._sequences.insert(pos, (sequence, placement, just))
 
+        # Workers only hold the sequences that existed when they were started
+        self.close()
+
     def render(self, force=False):
 
-        ct = time.time()
+        ct = self._clock()
 
         # minDuration and cooling values are (startTime, duration)
         # a sequence that is cooling cannot be activated
@@ -57,7 +114,7 @@ class collection():
         # Remove any sequence that's minDuration period has ended
         self._minTimer = {k: v for k, v in self._minTimer.items() if v[0] + v[1] >= ct}
 
-        renderList = []
+        active = []
         # Look for active sequences from highest priority to lowest
         for s, pl, j in reversed(self._sequences):
             m = s._minDuration
@@ -72,23 +129,209 @@ class collection():
                     self._minTimer[s] = (ct, m)
                     self._cooling[s] = (ct, c)
                     inUse = True
-                renderList.append((s, s.render(inUse)[0], pl, j))
+                active.append((s, inUse, pl, j))
             else:
                 if s in self._inUse:
                     self._inUse.remove(s)
 
-        if not self._inUse:
-            renderList.append((self._defaultCanvas, self._defaultCanvas.render(True)[0], (0, 0), 'lt'))
-
-        c = canvas(size=self.size)
-        for s, img, pl, j in renderList:
-            c.append(widget=image(img), placement=pl, anchor=j)
+        if self._processes > 0:
+            if not self._pool:
+                self._pool = _renderPool([s for s, pl, j in self._sequences], self._processes,
+                    self._dataset or self._sequences[0][0]._dataset, self.mode)
+            results = self._pool.render([(s, inUse) for s, inUse, pl, j in active])
+        else:
+            results = []
+            for s, inUse, pl, j in active:
+                img, changed = s.render(inUse)
+                results.append((img, changed, s.damage))
+        renderList = [(s, img, changed, damage, pl, j) for (s, inUse, pl, j), (img, changed, damage) in zip(active, results)]
 
-        return c.render()
+        if not self._inUse:
+            # Only force the default canvas when it first becomes visible
+            d = self._defaultCanvas
+            img, changed = d.render(not self._defaultInUse)
+            renderList.append((d, img, changed, d.damage, (0, 0), 'lt'))
+        self._defaultInUse = not self._inUse
+
+        # Only rebuild the canvas when the set of visible sequences has changed
+        placements = [(self._getPlacement(s), pl, j) for s, img, changed, damage, pl, j in renderList]
+        if placements != self._canvas.placements:
+            self._canvas.placements = placements
+            self._canvas._newWidget = True
+
+        for s, img, changed, damage, pl, j in renderList:
+            self._getPlacement(s).set(img, changed, damage)
+
+        img, changed = self._canvas.render(force)
+        self.damage = self._canvas.damage
+        return (img, changed)
+
+    def _getPlacement(self, s):
+        if s not in self._placements:
+            self._placements[s] = _placement()
+        return self._placements[s]
+
+    def close(self):
+        """
+        Stop any worker processes.  They are restarted by the next render
+        """
+        if self._pool:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _imageBytes(mode, size):
+    '''
+    Return the number of bytes needed to hold an image of mode and size
+    '''
+    return (size[0] + 7) // 8 * size[1] if mode == '1' else len(mode) * size[0] * size[1]
+
+
+def _renderWorker(conn, sequences, dataset, blocks):
+    '''
+    Render the sequences assigned to this worker process on request from the collection
+    '''
+    sent = set()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        updates, requests = msg
+        if updates:
+            with dataset.transaction():
+                for entry in updates:
+                    for dbName, update in entry.items():
+                        dataset.update(dbName, dict(update))
+
+        results = []
+        for i, force in requests:
+            img, changed = sequences[i].render(force)
+
+            # Only send images that the collection doesn't already have
+            data = length = None
+            if changed or i not in sent:
+                sent.add(i)
+                data = img.tobytes()
+                length = len(data)
+                if length <= blocks[i].size:
+                    blocks[i].buf[:length] = data
+                    data = None
+            results.append((i, changed, img.mode, img.size, sequences[i].damage, length, data))
+        conn.send(results)
+
+
+class _renderPool():
+    '''
+    Worker processes that each render a fixed subset of a collection's sequences.
+
+    The workers are forked so that they start with copies of the sequences and dataset.
+    Before each render they are sent the dataset updates made since the previous render and
+    they return their images through a shared memory block per sequence.
+    '''
+    def __init__(self, sequences, processes, dataset, mode='1'):
+        from multiprocessing import get_context
+        from multiprocessing.shared_memory import SharedMemory
+
+        ctx = get_context('fork')
+        self._dataset = dataset
+        self._index = {s: i for i, s in enumerate(sequences)}
+        self._images = {}
+
+        # Room for an image of the sequence's size
+        self._blocks = [SharedMemory(create=True, size=max(1, _imageBytes(mode, s.size))) for s in sequences]
+
+        ring = dataset._ringBuffer
+        self._lastSent = ring[-1] if ring else None
+        self._assigned = [i % processes for i in range(len(sequences))]
+        self._workers = []
+        for w in range(min(processes, len(sequences))):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_renderWorker, args=(child, sequences, dataset, self._blocks), daemon=True)
+            p.start()
+            child.close()
+            self._workers.append((p, parent))
+
+        # Stop the workers and free the shared memory even if close is never called
+        self._finalizer = weakref.finalize(self, self._shutdown, self._workers, self._blocks)
+
+    def _updates(self):
+        '''
+        Return the dataset updates that have not yet been sent to the workers
+        '''
+        ring = self._dataset._ringBuffer
+        if not ring or ring[-1] is self._lastSent:
+            return None
+        entries = list(ring)
+        for i in range(len(entries) - 1, -1, -1):
+            if entries[i] is self._lastSent:
+                updates = entries[i + 1:]
+                break
+        else:
+            if self._lastSent is None and len(entries) < ring.maxlen:
+                updates = entries
+            else:
+                # The last update sent has left the history so send every database in full
+                updates = [{k: dict(v) for k, v in self._dataset._dataset.items()}]
+        self._lastSent = entries[-1]
+        return updates
+
+    def render(self, requests):
+        '''
+        Render each (sequence, force) in requests returning [(img, changed, damage)]
+        '''
+        updates = self._updates()
+        work = [[] for w in self._workers]
+        for s, force in requests:
+            i = self._index[s]
+            work[self._assigned[i]].append((i, force))
+
+        # Every worker receives the updates even if it has nothing to render
+        for (p, conn), w in zip(self._workers, work):
+            conn.send((updates, w))
+
+        results = {}
+        for p, conn in self._workers:
+            for i, changed, mode, size, damage, length, data in conn.recv():
+                if data is not None:
+                    self._images[i] = Image.frombytes(mode, size, data)
+                elif length is not None:
+                    with self._blocks[i].buf[:length] as view:
+                        self._images[i] = Image.frombytes(mode, size, bytes(view))
+                results[i] = (self._images[i], changed, damage)
+        return [results[self._index[s]] for s, force in requests]
+
+    def close(self):
+        self._finalizer()
+
+    @staticmethod
+    def _shutdown(workers, blocks):
+        for p, conn in workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            p.join(1)
+            if p.is_alive():
+                p.terminate()
+            conn.close()
+        workers.clear()
+        for b in blocks:
+            b.close()
+            b.unlink()
+        blocks.clear()
 
 
 class sequence():
-    def __init__(self, name=None, condition='False', minDuration=0, priority=logging.INFO, coolingPeriod=0, dataset=None, canvases=None, defaultCanvas=None):
+    def __init__(self, name=None, condition='False', minDuration=0, priority=logging.INFO, coolingPeriod=0, dataset=None, canvases=None, defaultCanvas=None, clock=None):
         """
         Create a new sequence instance
 
@@ -100,6 +343,9 @@ class sequence():
         :type dataset: dict
         :param defaultCanvas: returned by render when there is no active canvas
         :type defaultCanvas: tinyDisplay.utility.widget
+        :param clock: function returning the current time in seconds used to time each
+            canvas.  Defaults to the dataset's clock
+        :type clock: function
         """
         self.name = name
         self._priority = priority if priority else logging.info
@@ -107,6 +353,7 @@ class sequence():
         self._coolingPeriod = coolingPeriod if coolingPeriod else 0
         self._dataset = Dataset(dataset) if dataset and type(dataset) is dict else dataset if dataset else Dataset()
         self._condition = self._dataset.compile(condition) if type(condition) is str else condition
+        self._clock = clock or self._dataset._clock
 
         if not defaultCanvas:
             defaultCanvas = image(image=Image.new('1', (0, 0)))  # Set an empty image if no defaultCanvas provided
@@ -115,6 +362,7 @@ class sequence():
         self.size = max((0, 0), self._defaultCanvas.size)
         self._canvases = []
         self._currentCanvas = None
+        self.damage = []
 
         # Populate canvases if provided
         if canvases:
@@ -164,9 +412,12 @@ class sequence():
             self.reset()
 
         c, new = self.activeCanvas()
-        if not c:
-            return self._defaultCanvas.render()
-        return c.render(new)
+        c = c or self._defaultCanvas
+        img, changed = c.render(new)
+
+        # Regions of the sequence's image that changed during this render
+        self.damage = c.damage
+        return (img, changed)
 
     def stop(self):
         for c in self._canvases:
@@ -230,7 +481,7 @@ class sequence():
         Reset canvas timer
         """
 
-        self.start = time.time()
+        self.start = self._clock()
 
     def _expiredCurrentCanvas(self):
         """
@@ -240,7 +491,7 @@ class sequence():
         :rtype: bool
         """
 
-        if time.time() - self.start > self._canvases[self._currentCanvas][1]:
+        if self._clock() - self.start > self._canvases[self._currentCanvas][1]:
             return True
         return False
 
@@ -252,7 +503,7 @@ class sequence():
         :rtype: bool
         """
 
-        if time.time() - self.start > self._canvases[self._currentCanvas][2]:
+        if self._clock() - self.start > self._canvases[self._currentCanvas][2]:
             return False
         return True
 
@@ -264,6 +515,177 @@ class sequence():
         :rtype: bool
         """
 
-        if time.time() - self.start > self._minDuration:
+        if self._clock() - self.start > self._minDuration:
             return False
         return True
+
+
+def _renderTree(obj):
+    '''
+    Yield obj and every widget, canvas and sequence rendered beneath it
+    '''
+    yield obj
+    if isinstance(obj, canvas):
+        for p in obj.placements:
+            yield from _renderTree(canvas._getPlacement(p)[0])
+    elif isinstance(obj, marquee):
+        yield from _renderTree(obj._widget)
+    elif isinstance(obj, sequence):
+        for c in obj._canvases:
+            yield from _renderTree(c[0])
+        yield from _renderTree(obj._defaultCanvas)
+    elif isinstance(obj, collection):
+        for s in obj._sequences:
+            yield from _renderTree(s[0])
+        yield from _renderTree(obj._defaultCanvas)
+        yield obj._canvas
+
+
+class renderAhead():
+    '''
+    Pre-render the next frames of a sequence, collection, canvas or widget from a
+    worker thread so that an expensive re-render does not delay the frames around it.
+
+    Frames are rendered in order into a buffer and returned by render (or get).  When
+    the dataset updates a value that the rendered objects depend upon, the buffered
+    frames are discarded and the marquees, canvases and sequences are rewound to the
+    first unconsumed frame before rendering resumes with the new data.  If the source
+    raises while rendering, the exception is raised from render (or get) once the
+    frames rendered before it have been returned.
+
+    Time based behavior (e.g. how long a sequence shows each canvas) is evaluated when
+    a frame is rendered which can be up to frames renders ahead of when it is displayed.
+
+    :param source: the object to render
+    :param dataset: the dataset source reads from.  Defaults to source's dataset
+    :param frames: the number of frames to render ahead
+    '''
+
+    # Attributes that carry an object's rendering state from one frame to the next
+    _stateAttrs = (
+        (widget, ('image', 'current', '_reprVal')),
+        (marquee, ('_tick', '_curPos', '_lastPos', '_aWI', '_timeline', '_pauses', '_pauseEnds')),
+        (scroll, ('_strip',)),
+        (canvas, ('_boxes', '_newWidget')),
+        (sequence, ('_currentCanvas', 'start')),
+    )
+
+    def __init__(self, source=None, dataset=None, frames=10):
+        assert source, 'You must supply an object to render'
+        self._source = source
+        self._dataset = dataset or getattr(source, '_dataset', None)
+        self._frames = frames
+        self.damage = []
+
+        self._stateful = []
+        statements = []
+        for obj in _renderTree(source):
+            attrs = tuple(a for cls, attrs in self._stateAttrs if isinstance(obj, cls) for a in attrs)
+            if attrs:
+                self._stateful.append((obj, attrs))
+            statements += getattr(obj, '_statements', ())
+            if isinstance(obj, sequence):
+                statements += [obj._condition] + [c[3] for c in obj._canvases]
+
+        # Only invalidate for the values that are read unless a statement's inputs can't be determined
+        if self._dataset is not None:
+            if all(type(s) is tuple and len(s) > 2 and s[2] is not None for s in statements):
+                for s in statements:
+                    self._dataset.subscribe(s, self._invalidate)
+            else:
+                self._dataset.subscribe(None, self._invalidate)
+
+        self._buffer = deque()
+        self._generation = 0
+        self._running = True
+        self._error = None
+        self._cond = Condition()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _invalidate(self):
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def _snapshot(self):
+        return [(obj, attrs, [getattr(obj, a) for a in attrs]) for obj, attrs in self._stateful]
+
+    @staticmethod
+    def _restore(snapshot):
+        for obj, attrs, values in snapshot:
+            for a, v in zip(attrs, values):
+                setattr(obj, a, v)
+            if isinstance(obj, widget):
+                # Values evaluated in the discarded frames were rewound so must be evaluated again
+                obj._dirty = True
+            if isinstance(obj, marquee) and obj._frames is not None:
+                obj._frames.clear()
+
+    def _run(self):
+        generation = self._generation
+        while True:
+            with self._cond:
+                while self._running and len(self._buffer) >= self._frames and generation == self._generation:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                if generation != self._generation:
+                    # Rewind to the oldest frame not yet consumed and discard the rest
+                    generation = self._generation
+                    if self._buffer:
+                        self._restore(self._buffer[0][1])
+                        self._buffer.clear()
+                snapshot = self._snapshot()
+
+            try:
+                img, changed = self._source.render()
+            except Exception as ex:
+                with self._cond:
+                    self._error = ex
+                    self._cond.notify_all()
+                return
+            damage = getattr(self._source, 'damage', None)
+
+            with self._cond:
+                if generation == self._generation:
+                    self._buffer.append((generation, snapshot, img, changed, damage))
+                    self._cond.notify_all()
+                elif not self._buffer:
+                    # Invalidated while rendering.  Undo this frame
+                    self._restore(snapshot)
+
+    def get(self, wait=0):
+        '''
+        Return the next frame as (img, changed) waiting up to wait seconds (forever if
+        None) for it to be rendered.  Returns None if no frame is available.
+
+        :raises Exception: the exception raised by the source while rendering the next frame
+        '''
+        def ready():
+            # Frames rendered before the latest dataset update are never returned
+            return self._buffer and self._buffer[0][0] == self._generation
+
+        with self._cond:
+            if wait != 0:
+                self._cond.wait_for(lambda: ready() or self._error is not None, wait)
+            if not ready():
+                if self._error is not None:
+                    raise self._error
+                return None
+            generation, snapshot, img, changed, damage = self._buffer.popleft()
+            self._cond.notify_all()
+        self.damage = damage
+        return (img, changed)
+
+    def render(self, *args, **kwargs):
+        '''
+        Return the next frame, waiting for it to be rendered if necessary
+        '''
+        return self.get(None)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
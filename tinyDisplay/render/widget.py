@@ -9,15 +9,16 @@ Widgets for the tinyDisplay system
 """
 import pathlib
 import abc
+import bisect
 
 from PIL import Image, ImageDraw
-from tinyDisplay.utility import dataset as Dataset
-from tinyDisplay.font import tdImageFont
+from tinyDisplay.utility import dataset as Dataset, intersectBox, mergeBoxes
+from tinyDisplay.font import tdImageFont, _lruCache
 
 
 class widget(metaclass=abc.ABCMeta):
 
-    def __init__(self, name=None, size=None, dataset=None, just='lt'):
+    def __init__(self, name=None, size=None, dataset=None, just='lt', mode='1'):
         """
         Create a new widget
 
@@ -25,15 +26,22 @@ class widget(metaclass=abc.ABCMeta):
         :type size: tuple
         :param dataset: shared dataset for all widgets, canvases, and sequences
         :type dataset: dict
+        :param mode: the PIL mode of the images the widget renders ('1', 'L' or 'RGB')
+        :type mode: str
         """
+        assert mode in ('1', 'L', 'RGB'), f'{mode} is not a supported image mode'
         self.name = name
+        self.mode = mode
         self._requestedSize = size
-        self._dataset = Dataset(dataset)
+        self._dataset = dataset if isinstance(dataset, Dataset) else Dataset(dataset)
         self.just = just.lower()
         self.type = self.__class__.__name__
         self.image = None
         self.current = None
+        self.damage = []
         self._reprVal = None
+        self._statements = ()
+        self._dirty = True
 
         self._computeLocalDB()
 
@@ -64,7 +72,7 @@ class widget(metaclass=abc.ABCMeta):
         """
         Set the image of the widget to empty and the default size of the widget
         """
-        self.image = Image.new("1", self.size)
+        self.image = Image.new(self.mode, self.size)
 
     def _eval(self, v):
         return self._dataset.eval(v, dataset=self._localDB)
@@ -75,6 +83,30 @@ class widget(metaclass=abc.ABCMeta):
         except (NameError, SyntaxError):
             return stmt
 
+    def _watch(self, *statements):
+        """
+        Subscribe to the values that the widget's statements depend upon so that the
+        statements only need to be evaluated again after one of those values is updated
+        """
+        self._statements = statements
+        self._dirty = True
+        for s in statements:
+            self._dataset.subscribe(s, self._invalidate)
+
+    def _invalidate(self):
+        self._dirty = True
+
+    def _needsEval(self, force=False):
+        """
+        Determine whether the widget's statements must be evaluated during this render
+        """
+        if not force and not self._dirty:
+            return False
+
+        # Clear before evaluating so that an update that arrives during evaluation is not lost
+        self._dirty = not all(self._dataset.isTracked(s) for s in self._statements)
+        return True
+
     def _place(self, retainImage=False, wImage=None, offset=(0, 0), just='lt'):
         just = just or 'lt'
         offset = offset or (0, 0)
@@ -93,7 +125,7 @@ class widget(metaclass=abc.ABCMeta):
 
         # If no existing image and a size has been requested, provision a new image
         if not self.image:
-            self.image = Image.new('1', self._requestedSize)
+            self.image = Image.new(self.mode, self._requestedSize)
 
         # If a size has been requested, crop the image to the requested size
         # Note: Not sure I need this, not executing during testing
@@ -101,11 +133,17 @@ class widget(metaclass=abc.ABCMeta):
             if self.image.size != self._requestedSize:
                 self.image = self.image.crop((0, 0, self._requestedSize[0], self._requestedSize[1]))
 
-        mh = round((self.image.size[0] - wImage.size[0]) / 2)
-        r = self.image.size[0] - wImage.size[0]
+        pos = self._computePlacement(self.image.size, wImage.size, offset, just)
+        self.image.paste(wImage, pos)
+        return pos
+
+    @staticmethod
+    def _computePlacement(size, wSize, offset=(0, 0), just='lt'):
+        mh = round((size[0] - wSize[0]) / 2)
+        r = size[0] - wSize[0]
 
-        mv = round((self.image.size[1] - wImage.size[1]) / 2)
-        b = self.image.size[1] - wImage.size[1]
+        mv = round((size[1] - wSize[1]) / 2)
+        b = size[1] - wSize[1]
 
         a = \
             0 if just[0] == 'l' else \
@@ -118,13 +156,17 @@ class widget(metaclass=abc.ABCMeta):
             b if just[1] == 'b' else \
             0
 
-        pos = (offset[0] + a, offset[1] + b)
-        self.image.paste(wImage, pos)
-        return (pos[0], pos[1])
+        return (offset[0] + a, offset[1] + b)
 
     def render(self, *args, **kwargs):
         self._computeLocalDB()
+
+        # _render may record the regions it changed in self.damage.  If it doesn't, a changed
+        # widget is assumed to be damaged over its whole area
+        self.damage = None
         img, changed = self._render(*args, **kwargs)
+        if self.damage is None:
+            self.damage = [(0, 0, img.size[0], img.size[1])] if changed and img else []
         return (img, changed)
 
     @abc.abstractmethod
@@ -141,6 +183,9 @@ class widget(metaclass=abc.ABCMeta):
         :return: a 2-tuple with the widget's current image and a flag to indicate whether
             the image has just changed.  If force was set, it will always return changed
         :rtype: (PIL.Image, bool)
+
+        After render returns, self.damage holds the list of (x0, y0, x1, y1) boxes within the
+        widget's image that changed during the render (empty if nothing changed).
         """
         pass    # pragma: no cover
 
@@ -157,11 +202,14 @@ class text(widget):
         self.font = font
         self.lineSpacing = lineSpacing
         self._cValue = self._compile(value)
+        self._watch(self._cValue)
         self._tsDraw = ImageDraw.Draw(Image.new('1', (0, 0)))
 
         self.render(force=True)
 
     def _render(self, force=False, *args, **kwargs):
+        if not self._needsEval(force):
+            return (self.image, False)
         value = str(self._eval(self._cValue))
 
         # If the string to render has not changed then return current image
@@ -173,7 +221,7 @@ class text(widget):
         tSize = self._tsDraw.textsize(value, font=self.font, spacing=self.lineSpacing)
         tSize = (0, 0) if tSize[0] == 0 else tSize
 
-        img = Image.new('1', tSize)
+        img = Image.new(self.mode, tSize)
         if img.size[0] != 0:
             d = ImageDraw.Draw(img)
             just = {'l': 'left', 'r': 'right', 'm': 'center'}.get(self.just[0])
@@ -198,7 +246,7 @@ class progressBar(widget):
 
         assert mask or barSize or self._requestedSize, 'You must either provide a mask image or provide a size for the progressBar'
         assert not (mask and barSize), 'You can either provide a mask image or a barSize but not both'
-        self.mask = mask if mask else self._defaultMask(barSize if barSize else self._requestedSize)
+        self.mask = mask if mask else self._defaultMask(barSize if barSize else self._requestedSize, self.mode)
         if type(mask) in [str, pathlib.PosixPath]:
             self.mask = Image.open(pathlib.PosixPath(mask))
         self.direction = direction.lower()
@@ -206,18 +254,15 @@ class progressBar(widget):
         range = range if range else (0, 100)
         self._cRange = (self._compile(range[0]), self._compile(range[1]))
         self._cValue = self._compile(value)
+        self._watch(self._cValue, *self._cRange)
 
     @staticmethod
-    def _defaultMask(size):
-        img = Image.new('RGB', size)
-        d = ImageDraw.Draw(img)
-        if size[0] - 1 < 3 or size[1] - 1 < 3:
-            d.rectangle((0, 0, size[0] - 1, size[1] - 1), fill='black', outline='black')
-        else:
-            d.rectangle((0, 0, size[0] - 1, size[1] - 1), fill='black', outline='white')
-        imga = img.copy().convert('L')
-        img.putalpha(imga)
-        img.load()
+    def _defaultMask(size, mode='1'):
+        # The mask is pasted using itself as the transparency mask so only its outline is drawn.
+        # PIL accepts '1' and 'L' images as transparency masks
+        img = Image.new('1' if mode == '1' else 'L', size)
+        if size[0] - 1 >= 3 and size[1] - 1 >= 3:
+            ImageDraw.Draw(img).rectangle((0, 0, size[0] - 1, size[1] - 1), fill='black', outline='white')
         return img
 
     @staticmethod
@@ -235,6 +280,8 @@ class progressBar(widget):
         return (scale - r0) / rangeSize
 
     def _render(self, force=False, *args, **kwargs):
+        if not self._needsEval(force):
+            return (self.image, False)
         value = self._eval(self._cValue)
         range = (self._eval(self._cRange[0]), self._eval(self._cRange[1]))
         scale = self._getScaler(value, range)
@@ -252,8 +299,8 @@ class progressBar(widget):
         (px, py) = (0, 0) if dir in ['ltr', 'ttb'] else (size[0] - w, 0) if dir == 'rtl' else (0, size[1] - h)
 
         # Build Fill
-        img = Image.new('1', size)
-        img.paste(Image.new('1', (w, h), 1), (px, py))
+        img = Image.new(self.mode, size)
+        img.paste(Image.new(self.mode, (w, h), 1 if self.mode == '1' else 'white'), (px, py))
         img.paste(self.mask, (0, 0), self.mask)
 
         self._place(wImage=img, just=self.just)
@@ -265,6 +312,7 @@ class canvas(widget):
         super().__init__(*args, **kwargs)
 
         self._newWidget = True
+        self._boxes = []
         self.placements = list(placements or [])
         self._reprVal = f'{len(self.placements) or "no"} widgets'
 
@@ -274,27 +322,60 @@ class canvas(widget):
         self._newWidget = True
 
     def _render(self, force=False, *args, **kwargs):
-        changed = False if not force and not self._newWidget and self.image else True
+        full = force or self._newWidget or not self.image or len(self._boxes) != len(self.placements)
 
         # Render all of the widgets on the canvas
         list = []
-
         for i in self.placements:
             wid, off, anc = self._getPlacement(i)
             img, updated = wid.render(force=force, *args, **kwargs)
-            list.append((img, off, anc))
-            if updated:
-                changed = True
+            list.append((wid, img, off, anc, updated))
 
-        # If any have changed, render a fresh canvas
-        if changed:
+        # If canvas is new or forced, render a fresh canvas
+        if full:
             self._newWidget = False
-            self.image = Image.new('1', self.size)
-            for img, off, anc in list:
-                self._place(retainImage=True, wImage=img, offset=off, just=anc)
+            self.image = Image.new(self.mode, self.size)
+            self._boxes = []
+            for wid, img, off, anc, updated in list:
+                pos = self._place(retainImage=True, wImage=img, offset=off, just=anc)
+                self._boxes.append((pos[0], pos[1], pos[0] + img.size[0], pos[1] + img.size[1]))
+            return (self.image, True)
+
+        # Otherwise compute which regions of the canvas were damaged by the widgets that changed
+        changed = False
+        boxes = []
+        damage = []
+        for i, (wid, img, off, anc, updated) in enumerate(list):
+            pos = self._computePlacement(self.image.size, img.size, off, anc or 'lt')
+            box = (pos[0], pos[1], pos[0] + img.size[0], pos[1] + img.size[1])
+            boxes.append(box)
+            if not updated:
+                continue
+            changed = True
+
+            # If the widget hasn't moved or changed size, only the parts it reports as damaged need repainting
+            if box == self._boxes[i] and wid.damage is not None:
+                damage += [(d[0] + pos[0], d[1] + pos[1], d[2] + pos[0], d[3] + pos[1]) for d in wid.damage]
+            else:
+                damage += [self._boxes[i], box]
+        self._boxes = boxes
+        self.damage = mergeBoxes(damage, (0, 0, self.image.size[0], self.image.size[1]))
+
+        if self.damage:
+            self._repaint([img for wid, img, off, anc, updated in list], boxes)
 
         return (self.image, changed)
 
+    def _repaint(self, images, boxes):
+        # Images already returned to callers are never modified so repaint a copy
+        self.image = self.image.copy()
+        for d in self.damage:
+            region = Image.new(self.mode, (d[2] - d[0], d[3] - d[1]))
+            for img, box in zip(images, boxes):
+                if intersectBox(box, d):
+                    region.paste(img, (box[0] - d[0], box[1] - d[1]))
+            self.image.paste(region, (d[0], d[1]))
+
     @staticmethod
     def _getPlacement(item):
         if len(item) == 3:
@@ -309,9 +390,65 @@ class canvas(widget):
         return (w, o, a)
 
 
+class _timeline():
+    '''
+    Sequence of marquee positions indexed by tick.
+
+    Stored as segments of (startTick, length, position, delta, every) where the
+    position at tick startTick + k is position + delta * (k // every).  This lets a
+    pause or a movement be added in constant time and memory regardless of how many
+    ticks it lasts.
+    '''
+    def __init__(self):
+        self._starts = []
+        self._segments = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError('timeline index out of range')
+        i = bisect.bisect_right(self._starts, index) - 1
+        start, length, pos, delta, every = self._segments[i]
+        k = (index - start) // every
+        return (pos[0] + delta[0] * k, pos[1] + delta[1] * k)
+
+    def append(self, pos):
+        self.addSegment(pos, 1)
+
+    def addSegment(self, pos, length, delta=(0, 0), every=1):
+        if length <= 0:
+            return
+        self._starts.append(self._len)
+        self._segments.append((self._len, length, pos, delta, every))
+        self._len += length
+
+    def pop(self):
+        retval = self[-1]
+        start, length, pos, delta, every = self._segments[-1]
+        if length == 1:
+            self._starts.pop()
+            self._segments.pop()
+        else:
+            self._segments[-1] = (start, length - 1, pos, delta, every)
+        self._len -= 1
+        return retval
+
+
 class marquee(widget):
 
-    def __init__(self, widget=None,  resetOnChange=True, actions=('rtl',), speed=1, distance=1, tps=30, condition=None, *args, **kwargs):
+    def __init__(self, widget=None,  resetOnChange=True, actions=('rtl',), speed=1, distance=1, tps=30, condition=None, frameCache=0, *args, **kwargs):
+        """
+        :param frameCache: maximum number of rendered frames to keep for replay while the
+            widget's content is unchanged.  0 (the default) disables the cache.  To turn a
+            full cycle into lookups it must be at least the number of distinct positions in
+            the timeline; least recently used frames are discarded beyond that.
+        :type frameCache: int
+        """
         super().__init__(*args, **kwargs)
         assert widget, "No widget supplied to initialize scroll"
 
@@ -324,8 +461,9 @@ class marquee(widget):
             self._actions.append(a)
         self._distance = int(distance)
         self._tps = tps
-        self._timeline = []
+        self._timeline = _timeline()
         self._tick = 0
+        self._frames = _lruCache(frameCache) if frameCache else None
         self._condition = \
             self._dataset.compile(condition) if type(condition) is str else \
             condition if condition else self._shouldIMove
@@ -366,8 +504,7 @@ class marquee(widget):
     def _addPause(self, length, startingPos, tickCount):
         self._pauses.append(tickCount)
         tickCount += int(length * self._tps)
-        for i in range(int(length * self._tps)):
-            self._timeline.append(startingPos)
+        self._timeline.addSegment(startingPos, int(length * self._tps))
         return tickCount
 
     def _addMovement(self, length, direction, startingPos, tickCount):
@@ -379,16 +516,17 @@ class marquee(widget):
             self._timeline.append(curPos)
             tickCount = 1
 
-        for _ in range(length // self._distance):
-            dir = (self._distance, 0) if direction == 'ltr' else \
-            (-self._distance, 0) if direction == 'rtl' else \
-            (0, self._distance) if direction == 'ttb' else \
-            (0, -self._distance)
-            curPos = (curPos[0] + dir[0], curPos[1] + dir[1])
-
-            for _ in range(self._timeRatio):
-                self._timeline.append(curPos)
-                tickCount += 1
+        dir = (self._distance, 0) if direction == 'ltr' else \
+        (-self._distance, 0) if direction == 'rtl' else \
+        (0, self._distance) if direction == 'ttb' else \
+        (0, -self._distance)
+
+        # Each step moves distance pixels and is held for timeRatio ticks
+        steps = length // self._distance
+        if steps > 0:
+            self._timeline.addSegment((curPos[0] + dir[0], curPos[1] + dir[1]), steps * self._timeRatio, dir, self._timeRatio)
+            curPos = (curPos[0] + dir[0] * steps, curPos[1] + dir[1] * steps)
+            tickCount += steps * self._timeRatio
         return (curPos, tickCount)
 
     def _reset(self):
@@ -398,8 +536,16 @@ class marquee(widget):
         self._adjustWidgetSize()
         tx, ty = self._place(wImage=self._aWI, just=self.just)
         self._curPos = self._lastPos = (tx, ty)
-        self._timeline = []
+        self._timeline = _timeline()
         self._computeTimeline()
+        if self._frames is not None:
+            self._frames.clear()
+
+    def cacheInfo(self):
+        """
+        Report hits, misses, maxsize and currsize of the frame cache (None if disabled)
+        """
+        return self._frames.info if self._frames is not None else None
 
     @staticmethod
     def _withinDisplayArea(pos, d):
@@ -424,6 +570,8 @@ class marquee(widget):
         img, updated = self._widget.render(force=force, tick=tick, move=move)
         if updated:
             self._adjustWidgetSize()
+            if self._frames is not None:
+                self._frames.clear()
         if (updated and self._resetOnChange) or force:
             self._reset()
             self._tick = self._tick + 1 if move else self._tick
@@ -433,7 +581,12 @@ class marquee(widget):
         self._curPos = self._timeline[self._tick % len(self._timeline)]
 
         if self._curPos != self._lastPos or updated:
-            self.image = self._paintScrolledWidget()
+            if self._frames is not None and not updated:
+                # Frames depend only upon position until the content changes (which resets the cache)
+                img = self._frames.get(self._curPos)
+                self.image = img if img is not None else self._frames.put(self._curPos, self._paintScrolledWidget())
+            else:
+                self.image = self._paintScrolledWidget()
             moved = True
             self._lastPos = self._curPos
 
@@ -494,7 +647,7 @@ class slide(marquee):
             self._timeline.append(self._curPos)
 
     def _paintScrolledWidget(self):
-        img = Image.new('1', self.size)
+        img = Image.new(self.mode, self.size)
         img.paste(self._aWI, self._curPos)
         return img
 
@@ -547,6 +700,7 @@ class scroll(marquee):
         sizeX = self._widget.size[0] + gapX
         sizeY = self._widget.size[1] + gapY
         self._aWI = self._widget.image.crop((0, 0, sizeX, sizeY))
+        self._strip = None
 
     def _computeTimeline(self):
         if self._dataset.eval(self._condition):
@@ -589,11 +743,30 @@ class scroll(marquee):
         return lShadows
 
     def _paintScrolledWidget(self):
-        img = Image.new('1', self.size)
-        pasteList = self._computeShadowPlacements()
-        for p in pasteList:
-            img.paste(self._aWI, p)
-        return img
+        # The first frame after the content changes is painted directly.  If the content
+        # is still the same when the next frame is needed, tile it into a strip (three copies
+        # along each direction of movement) so that every later frame is a single crop
+        if self._strip is None:
+            self._strip = False
+            img = Image.new(self.mode, self.size)
+            pasteList = self._computeShadowPlacements()
+            for p in pasteList:
+                img.paste(self._aWI, p)
+            return img
+
+        w, h = self._aWI.size
+        if not self._strip:
+            nx = 3 if self._movement[0] else 1
+            ny = 3 if self._movement[1] else 1
+            self._strip = Image.new(self.mode, (w * nx, h * ny))
+            for i in range(nx):
+                for j in range(ny):
+                    self._strip.paste(self._aWI, (i * w, j * h))
+
+        # The centre copy in the strip is the one at curPos
+        x = (w if self._movement[0] else 0) - self._curPos[0]
+        y = (h if self._movement[1] else 0) - self._curPos[1]
+        return self._strip.crop((x, y, x + self.size[0], y + self.size[1]))
 
 
 class staticWidget(widget):
@@ -620,10 +793,10 @@ class image(staticWidget):
             self._reprVal = f'img at 0x{id(image):x}'
             img = image.copy()
 
-        self._place(wImage=img, just=self.just)
+        self._place(wImage=img if img.mode == self.mode else img.convert(self.mode), just=self.just)
 
 
-def makeFourTupleDraw(xy):
+def makeFourTupleDraw(xy, mode='1'):
     if len(xy) == 4:
         x0, y0, x1, y1 = xy[0], xy[1], xy[2], xy[3]
     elif len(xy) == 2:
@@ -631,7 +804,7 @@ def makeFourTupleDraw(xy):
     else:
         raise ValueError(f"xy must be an array of two tuples or four integers.  Instead received {xy}")
 
-    img = Image.new('1', (max(x0, x1) + 1, max(y0, y1) + 1))
+    img = Image.new(mode, (max(x0, x1) + 1, max(y0, y1) + 1))
     drw = ImageDraw.Draw(img)
     return (img, drw)
 
@@ -641,7 +814,7 @@ class line(staticWidget):
     def __init__(self, xy=[], fill='white', width=0, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        img, d = makeFourTupleDraw(xy)
+        img, d = makeFourTupleDraw(xy, self.mode)
         d.line(xy, fill=fill, width=width)
 
         self._reprVal = f'{xy}'
@@ -653,7 +826,7 @@ class rectangle(staticWidget):
     def __init__(self, xy=[], fill='white', outline=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        img, d = makeFourTupleDraw(xy)
+        img, d = makeFourTupleDraw(xy, self.mode)
         d.rectangle(xy, fill=fill, outline=outline)
 
         self._reprVal = f'{xy}'
@@ -8,22 +8,47 @@ Utility functions to support tinyDisplay
 .. versionadded:: 0.0.1
 """
 
-import builtins, os, time, json
+import ast, asyncio, builtins, os, time, json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
 from threading import Thread, Event, RLock
+from weakref import WeakMethod
 from queue import Queue, Empty
-from copy import deepcopy
-from collections import deque
+from bisect import bisect_right
+from collections import deque, ChainMap
+from collections.abc import Mapping
 
 from simple_pid import PID
 
 
 
 class animate(Thread):
-    def __init__(self, Kp=1, Ki=0.1, Kd=0.05, cps=1, function=None, queueSize=10, *args, **kwargs):
+    '''
+    Invoke function cps times per second from a background thread placing the
+    results in a queue.
+
+    :param pacing: 'pid' (default) corrects the sleep between frames using a PID
+        controller.  'deadline' schedules each frame at an absolute time on the
+        monotonic clock, skipping frames when rendering overruns and recording
+        per-frame render time, lateness and dropped frames (see stats)
+    :param statsSize: number of recent frames to retain timings for in deadline mode
+    :param clock: the clock used to schedule frames in deadline mode (time.monotonic by default)
+    :param sleep: the function used to wait for the next frame in deadline mode (time.sleep by default)
+    '''
+    def __init__(self, Kp=1, Ki=0.1, Kd=0.05, cps=1, function=None, queueSize=10, pacing='pid', statsSize=300, clock=time.monotonic, sleep=time.sleep, *args, **kwargs):
         Thread.__init__(self)
         assert function, 'You must supply a function to animate'
+        assert pacing in ('pid', 'deadline'), f'{pacing} is not a valid pacing mode'
         self._speed = 1/cps
         self._pid = PID(Kp, Ki, Kd, setpoint = self._speed, sample_time=self._speed)
+        self._pacing = pacing
+        self._clock = clock
+        self._sleep = sleep
+        self._renderTimes = deque(maxlen=statsSize)
+        self._lateness = deque(maxlen=statsSize)
+        self.frames = 0
+        self.dropped = 0
 
         self._function = function
         self._args = args
@@ -101,6 +126,30 @@ class animate(Thread):
             except Empty:
                 break
 
+    @property
+    def stats(self):
+        '''
+        Frame statistics collected in deadline pacing mode.  Times are in seconds
+        and cover the most recent statsSize frames.
+        '''
+        def _summary(values):
+            if not values:
+                return {'mean': 0, 'max': 0}
+            return {'mean': sum(values)/len(values), 'max': max(values)}
+
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'renderTime': _summary(self._renderTimes),
+            'lateness': _summary(self._lateness),
+        }
+
+    def resetStats(self):
+        self.frames = 0
+        self.dropped = 0
+        self._renderTimes.clear()
+        self._lateness.clear()
+
 
     def _invoke(self, *args, **kwargs):
         # Invoke function
@@ -116,6 +165,72 @@ class animate(Thread):
 
 
     def run(self):
+        if self._pacing == 'deadline':
+            self._runDeadline()
+        else:
+            self._runPID()
+
+    def _runDeadline(self):
+        clock = self._clock
+        speed = self._speed
+
+        renderTimer = clock()
+        renderCounter = 0
+        self._event.set()
+        self._Force = False
+        deadline = clock()
+
+        while self._running:
+
+            # Compute current FPS every 5 seconds
+            renderCounter += 1
+            if renderTimer + 5 < clock():
+                self.fps = renderCounter/5
+                renderCounter = 0
+                renderTimer = clock()
+
+            if not self._event.isSet():
+                # Paused.  Resume the schedule from when we are restarted
+                self._event.wait()
+                deadline = clock()
+
+            deadline += speed
+            delay = deadline - clock()
+            if delay > 0:
+                self._sleep(delay)
+
+            start = clock()
+            self._lateness.append(start - deadline)
+            if self._Force:
+                self._Force = False
+                self._emptyQueue()
+
+                # Must put value in queue before clearing the forceRender Event
+                # so that the forced render receives the newly computed value
+                retval = self._invoke(*self._args, **self._kwargs)
+                self._renderTimes.append(clock() - start)
+                self._queue.put( retval )
+                self._forceEvent.set()
+            else:
+                retval = self._invoke(*self._args, **self._kwargs)
+                self._renderTimes.append(clock() - start)
+
+                # Time spent blocked on a full queue is the consumer's
+                # backpressure, not a missed deadline
+                putStart = clock()
+                self._queue.put( retval )
+                deadline += clock() - putStart
+            self.frames += 1
+
+            # If rendering overran, skip the frames whose deadlines have passed
+            # rather than trying to catch up
+            behind = clock() - deadline
+            if behind > speed:
+                missed = int(behind/speed)
+                self.dropped += missed
+                deadline += missed * speed
+
+    def _runPID(self):
           correction = 0
           loopTime = self._speed
 
@@ -172,17 +287,325 @@ class animate(Thread):
 
 
 
+class asyncAnimate():
+    '''
+    Asyncio version of animate.  Invokes function cps times per second from a task
+    running on the current event loop and places the results in an asyncio.Queue.
+
+    Frames are paced against the loop's clock (loop.time) using absolute deadlines
+    so no PID correction is needed.  If function returns an awaitable it is awaited.
+    '''
+    def __init__(self, cps=1, function=None, queueSize=10, *args, **kwargs):
+        assert function, 'You must supply a function to animate'
+        self._speed = 1/cps
+
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+
+        self.fps = 0
+        self._running = False
+        self._queueSize = queueSize
+        self._queue = None
+        self._event = None
+        self._task = None
+        self._wake = None
+        self._force = None
+
+    @property
+    def empty(self):
+        return self._queue.empty()
+
+    @property
+    def full(self):
+        return self._queue.full()
+
+    @property
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self):
+        '''
+        Start animating.  Must be called from within a running event loop.
+        '''
+        self._queue = asyncio.Queue(maxsize=self._queueSize)
+        self._event = asyncio.Event()
+        self._event.set()
+        self._wake = asyncio.Event()
+        self._running = True
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        return self._task
+
+    def pause(self):
+        self._event.clear()
+
+    def restart(self):
+        self._event.set()
+
+    def toggle(self):
+        if self._event.is_set():
+            self._event.clear()
+        else:
+            self._event.set()
+
+    async def stop(self):
+        '''
+        Stop animating.  A force that has not completed is cancelled.
+        '''
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Release anything still waiting on a force that run never handled
+        if self._force and not self._force.done():
+            self._force.cancel()
+        self._force = None
+
+    async def force(self, *args, **kwargs):
+        '''
+        Discard any queued results and render immediately using the new arguments.
+        Returns once the forced result has been placed in the queue.  Forces made
+        before run has handled a pending force share its render and the latest
+        arguments are used.
+        '''
+        self._args = args
+        self._kwargs = kwargs
+
+        self._emptyQueue()
+        if self._force is None or self._force.done():
+            self._force = asyncio.get_event_loop().create_future()
+        force = self._force
+
+        # Wake run if it is waiting on the pace timer or paused
+        self._wake.set()
+        await force
+
+    async def get(self, wait=0):
+        '''
+        Return the next result, waiting up to wait seconds for one to arrive.
+        Returns None if no result is available.
+        '''
+        if not wait:
+            try:
+                retval = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+        else:
+            try:
+                retval = await asyncio.wait_for(self._queue.get(), wait)
+            except asyncio.TimeoutError:
+                return None
+        self._queue.task_done()
+        return retval
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._running and self._queue.empty():
+            raise StopAsyncIteration
+        retval = await self._queue.get()
+        self._queue.task_done()
+        return retval
+
+    def _emptyQueue(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except asyncio.QueueEmpty:
+                break
+
+    async def _invoke(self):
+        retval = self._function(*self._args, **self._kwargs)
+        if asyncio.iscoroutine(retval) or isinstance(retval, asyncio.Future):
+            retval = await retval
+        return retval
+
+    async def _sleepUntil(self, deadline, loop):
+        '''
+        Wait until deadline or until force wakes the loop early
+        '''
+        delay = deadline - loop.time()
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+
+        renderTimer = loop.time()
+        renderCounter = 0
+        deadline = loop.time()
+
+        while self._running:
+
+            # Compute current FPS every 5 seconds
+            renderCounter += 1
+            if renderTimer + 5 < loop.time():
+                self.fps = renderCounter/5
+                renderCounter = 0
+                renderTimer = loop.time()
+
+            if not self._event.is_set() and not self._force:
+                # Wait until restarted (or forced) then resume pacing from now
+                pauseTask = loop.create_task(self._event.wait())
+                wakeTask = loop.create_task(self._wake.wait())
+                try:
+                    await asyncio.wait([pauseTask, wakeTask], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    # Also cancel the waits when stop cancels run
+                    pauseTask.cancel()
+                    wakeTask.cancel()
+                deadline = loop.time()
+
+            deadline += self._speed
+            await self._sleepUntil(deadline, loop)
+            self._wake.clear()
+
+            if self._force:
+                force, self._force = self._force, None
+                self._emptyQueue()
+
+                # Must put value in queue before completing the force
+                # so that the forced render receives the newly computed value
+                try:
+                    await self._queue.put(await self._invoke())
+                except asyncio.CancelledError:
+                    force.cancel()
+                    raise
+                if not force.done():
+                    force.set_result(True)
+                deadline = loop.time()
+                continue
+
+            if not self._event.is_set():
+                continue
+
+            retval = await self._invoke()
+            if self._queue.full():
+                # Consumer is behind.  Wait for room and don't try to catch up
+                # on the ticks missed while blocked
+                await self._queue.put(retval)
+                deadline = loop.time()
+            else:
+                self._queue.put_nowait(retval)
+
+            # If we fell more than a frame behind, restart the schedule from now
+            if loop.time() - deadline > self._speed:
+                deadline = loop.time()
+
+
+class virtualClock():
+    '''
+    A clock that only moves when it is told to.  Call the clock to read the current
+    time.  Used in place of time.time so that rendering can be run faster (or slower)
+    than real time.
+
+    :param start: the initial time in seconds.  Defaults to the current time
+    :type start: float
+    '''
+    def __init__(self, start=None):
+        self._time = time.time() if start is None else start
+
+    def __call__(self):
+        return self._time
+
+    def __repr__(self):
+        return f'<virtualClock {self._time:.3f}>'
+
+    def advance(self, seconds):
+        '''
+        Move the clock forward by seconds
+
+        :return: the new time
+        '''
+        assert seconds >= 0, 'A virtualClock cannot move backwards'
+        self._time += seconds
+        return self._time
+
+    def set(self, t):
+        '''
+        Move the clock to time t
+        '''
+        assert t >= self._time, 'A virtualClock cannot move backwards'
+        self._time = t
+
+
+class _sharedMap(Mapping):
+    '''
+    Read-only database made of a base dict and an overlay holding the values changed since
+    the base was built.  Neither is modified once the map is created so readers in other
+    threads always see a complete version.  updated() returns a new map that shares the
+    base, so its cost depends on the number of keys changed rather than the size of the
+    database.  The base is rebuilt once the overlay grows past an eighth of its size.
+    '''
+    __slots__ = ('_base', '_overlay', '_len')
+
+    def __init__(self, base, overlay=None, length=None):
+        self._base = base
+        self._overlay = overlay or {}
+        self._len = len(base) if length is None else length
+
+    def __getitem__(self, key):
+        try:
+            return self._overlay[key]
+        except KeyError:
+            return self._base[key]
+
+    def __contains__(self, key):
+        return key in self._overlay or key in self._base
+
+    def __iter__(self):
+        yield from self._base
+        yield from (k for k in self._overlay if k not in self._base)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return dict(self).__repr__()
+
+    def copy(self):
+        return dict(self)
+
+    def updated(self, update):
+        '''
+        Return a new map with the values in update applied
+        '''
+        base, overlay = self._base, self._overlay.copy()
+        length = self._len
+        for k in update:
+            if k not in overlay and k not in base:
+                length += 1
+        overlay.update(update)
+        if len(overlay) > 8 and len(overlay) > len(base) // 8:
+            return _sharedMap({**base, **overlay})
+        return _sharedMap(base, overlay, length)
+
+
 class dataset():
     '''
     Used to manage data that tinyDisplay will use to render widgets and test conditions
 
     '''
 
-    def __init__(self, data=None, dataset=None, suppressErrors=False, returnOnError='', historySize=100):
+    def __init__(self, data=None, dataset=None, suppressErrors=False, returnOnError='', historySize=100, clock=None):
         '''
         Initialize the dataset with the dictionary provided in 'data' (or optionally 'dataset').
         All keys at the root of the data dictionary must be strings as they will become
         the names of the databases contained within the dataset
+
+        clock is the function used to timestamp updates (time.time by default).  Sequences
+        that use the dataset share its clock unless given their own.
         '''
 
         if data and dataset:
@@ -205,22 +628,37 @@ class dataset():
         self._dataset = {}
 
         # Start the clock
-        self._startedAt = time.time()
-
-        ''' Initialize starting position.  This dictionary holds a version of the
-            dataset that can be safely walked forward from through all of the updates
-            in the ring buffer to get to current state '''
-        self._dsStart = {}
+        self._clock = clock or time.time
+        self._startedAt = self._clock()
 
         # Initialize ring buffer which will hold each update
         self._ringBuffer = deque(maxlen=self._historySize)
 
-        # Set self.update to initial update method
-        self.update = self._update
+        # Set self._commit to initial commit method
+        self._commit = self._commitInitial
+
+        ''' Updates made within a transaction are held in _batch until the transaction completes.
+            lock is held while updates are being applied (and for the whole of a transaction) '''
+        self._batch = None
+        self._batchDepth = 0
+        self.lock = RLock()
 
-        # Initialize prev dataset
-        self._prevDS = {}
-#        self.__dict__['prev'] = self._Data(self._prevDS)
+        ''' Index of the values each database has held.  _keyHistory[db][key] holds a list of the
+            versions of db in which key was updated and a list of the values it was given.
+            _versions[db] is the current version of db and _floor[db] is the oldest version that
+            can still be reconstructed (0 if none of db's updates have left the ring buffer) '''
+        self._keyHistory = {}
+        self._versions = {}
+        self._floor = {}
+
+        ''' Subscribers to be notified when the values they depend upon are updated.
+            Indexed by database name and then by key (None for subscribers that depend on the whole database) '''
+        self._subscribers = {}
+
+        ''' Databases whose contents are owned by the dataset.  A database provided by the caller
+            may be changed directly by the caller so it can't be tracked until the dataset has
+            replaced it with its own copy during an update '''
+        self._owned = set()
 
         # If data was provided during initialization, update the state of the dataset with it
         if dataset:
@@ -243,21 +681,24 @@ class dataset():
 
     def __getitem__(self, key):
         if key == 'prev':
-            return self._Data(self.prev)
+            return self.prev
         return self._dataset[key]
 
     def __iter__(self):
-        self._dataset['prev'] = self._Data(self.prev)
-        return iter(self._dataset)
+        yield from self._dataset
+        yield 'prev'
 
     def __len__(self):
         return len(self._dataset)
 
+    def __contains__(self, key):
+        return key == 'prev' or key in self._dataset
+
     def __repr__(self):
         return self._dataset.__repr__()
 
     def _checkForReserved(self, dbName):
-        if dbName in self.__class__.__dict__:
+        if dbName in self.__class__.__dict__ or dbName in self.__dict__:
             raise NameError(f'{dbName} is a reserved name and cannot be used witin a dataset')
 
     def keys(self):
@@ -274,56 +715,194 @@ class dataset():
 
         self.update(dbName, db)
 
-    def _baseUpdate(self, dbName, update):
+    def update(self, dbName, update):
         '''
         Update database named dbName using the dictionary contained within update.
+        Within a transaction the update is held until the transaction completes.
         '''
-        # Add timestamp to update
-        update['__timestamp__'] = time.time()-self._startedAt
+        with self.lock:
+            if self._batch is None:
+                self._commit({dbName: update})
+            elif dbName in self._batch:
+                self._batch[dbName] = {**self._batch[dbName], **update}
+            else:
+                self._batch[dbName] = update
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Apply every update made within the with block as a single update.  All of the databases
+        receive the same timestamp, the updates are stored as one entry in the history and
+        subscribers are notified once after all of the updates have been applied.  If the block
+        raises an exception none of its updates are applied.
 
-        if dbName not in self._dataset:
-            self._checkForReserved(dbName)
-            d = update
-            # Initialize _prevDS with current values
-            self._prevDS[dbName] = d
-        else:
-            # Update prevDS with the current values that are about to get updated
-            self._prevDS[dbName]= { **self._prevDS[dbName], **self._dataset[dbName] }
+        Other threads that update the dataset wait until the transaction completes.
 
-            # Merge current db values with new values
-            d = { **self._dataset[dbName], **update }
+        Example::
 
-        self.__dict__[dbName] = d
-        self._dataset[dbName] = d
-        self._ringBuffer.append( { dbName: update })
+            with ds.transaction():
+                ds.update('db', {'artist': 'Sting'})
+                ds.update('sys', {'temp': 54.3})
+        '''
+        with self.lock:
+            if not self._batchDepth:
+                self._batch = {}
+            self._batchDepth += 1
+            try:
+                yield self
+            except BaseException:
+                if self._batchDepth == 1:
+                    self._batch = None
+                raise
+            finally:
+                self._batchDepth -= 1
+
+            if not self._batchDepth and self._batch is not None:
+                batch, self._batch = self._batch, None
+                if batch:
+                    self._commit(batch)
+
+    def _baseUpdate(self, updates):
+        '''
+        Apply updates, a dictionary of updates indexed by the name of the database they are for
+        '''
+        # Add timestamp to update
+        timestamp = self._clock()-self._startedAt
+
+        for dbName, update in updates.items():
+            update['__timestamp__'] = timestamp
+
+            if dbName not in self._dataset:
+                self._checkForReserved(dbName)
+                d = update
+                self._keyHistory[dbName] = {}
+                self._versions[dbName] = 0
+                self._floor[dbName] = 0
+            elif dbName in self._owned:
+                # Share the unchanged values with the previous version so the cost depends only on
+                # the number of keys updated.  Readers holding the previous version are unaffected
+                d = self._dataset[dbName].updated(update)
+            else:
+                # Replace the caller's database with the dataset's own copy on its first update
+                d = _sharedMap({ **self._dataset[dbName], **update })
+                self._owned.add(dbName)
+
+            # Record the new values in the history index
+            version = self._versions[dbName] + 1
+            self._versions[dbName] = version
+            kh = self._keyHistory[dbName]
+            for k, v in update.items():
+                if k not in kh:
+                    kh[k] = ([], [])
+
+                # Add the value before its version so a concurrent reader never finds a version without one
+                kh[k][1].append(v)
+                kh[k][0].append(version)
+
+            self.__dict__[dbName] = d
+            self._dataset[dbName] = d
+
+        self._prev = None
+        self._ringBuffer.append(updates)
+        self._notify(updates)
+
+    def _oldestVersion(self, dbName):
+        '''
+        Return the oldest version of dbName that can still be reconstructed from the history index
+        '''
+        return min(self._floor[dbName], self._versions[dbName] - 1)
+
+    def _evict(self, entry):
+        '''
+        Remove history that is no longer needed once entry (the oldest update in the ring buffer) is discarded
+        '''
+        for db, update in entry.items():
+            self._floor[db] += 1
+
+            # Keep what is needed to reconstruct the oldest retained version and the previous version
+            keep = self._oldestVersion(db)
+            kh = self._keyHistory[db]
+            for k in update:
+                versions, values = kh[k]
+                i = bisect_right(versions, keep) - 1
+
+                # Replace both lists at once so a concurrent reader never sees them misaligned.
+                # Waiting until half of the entries are unneeded keeps the copying proportional
+                # to the number of updates
+                if i > 0 and i * 2 >= len(versions):
+                    kh[k] = (versions[i:], values[i:])
+
+    def subscribe(self, statement, callback):
+        '''
+        Request that callback be called whenever a value that the compiled statement depends upon
+        is updated.  Only a weak reference to callback (which must be a bound method) is kept.
+        If statement is None, callback is called after every update.
+        '''
+        if statement is None:
+            self._subscribers.setdefault(None, {}).setdefault(None, []).append(WeakMethod(callback))
+            return
+        deps = statement[2] if type(statement) is tuple and len(statement) > 2 else None
+        for db, key in deps or []:
+            self._subscribers.setdefault(db, {}).setdefault(key, []).append(WeakMethod(callback))
+
+    def _notify(self, updates):
+        # Collect the callbacks first so that each subscriber is only called once
+        callbacks = set()
+        for dbName, update in [*updates.items(), (None, ())]:
+            subs = self._subscribers.get(dbName)
+            if not subs:
+                continue
+            for key in [None, *update.keys()]:
+                if key in subs:
+                    refs = subs[key]
+                    for ref in list(refs):
+                        cb = ref()
+                        if cb:
+                            callbacks.add(cb)
+                        else:
+                            refs.remove(ref)
+        for cb in callbacks:
+            cb()
+
+    def isTracked(self, statement):
+        '''
+        Returns True if every change to the values that statement depends upon will be reported
+        to subscribers.  Statements that call functions, use changed or time, or read databases that
+        the caller may modify directly must be evaluated every time.
+        '''
+        if type(statement) is tuple:
+            deps = statement[2] if len(statement) > 2 else None
+            return deps is not None and all(db in self._owned for db, key in deps)
+        return not callable(statement)
 
-    def _update(self, dbName, update):
-        ''' Initial update method used when _ringBuffer is not full '''
+    def _commitInitial(self, updates):
+        ''' Initial commit method used when _ringBuffer is not full '''
 
-        self._baseUpdate(dbName, update)
+        self._baseUpdate(updates)
 
-        # If the ringBuffer has become full switch to _updateFull from now on
+        # If the ringBuffer has become full switch to _commitFull from now on
         if len(self._ringBuffer) == self._ringBuffer.maxlen:
-            self.update = self._updateFull
+            self._commit = self._commitFull
 
-
-    def _updateFull(self, dbName, update):
+    def _commitFull(self, updates):
         ''' Adds updating of starting position when the ring buffer has become full '''
 
-        # Add databases from oldest ringbuffer entry into dsStart if dsStart does not already contain them
-        for db in self._ringBuffer[0]:
-            if db not in self._dsStart:
-                self._dsStart[db] = self._ringBuffer[0][db]
-
-        # Merge values that already exist in dsStart
-        for db in self._dsStart:
-            if db in self._ringBuffer[0]:
-                self._dsStart[db] = { **self._dsStart[db], **self._ringBuffer[0][db] }
+        self._evict(self._ringBuffer[0])
+        self._baseUpdate(updates)
 
-        self._baseUpdate(dbName, update)
+    @property
+    def _dsStart(self):
+        '''
+        Starting position.  A version of the dataset that can be safely walked forward from
+        through all of the updates in the ring buffer to get to current state
+        '''
+        return {db: dict(self._Version(self._keyHistory[db], v)) for db, v in self._floor.items() if v}
 
 
     def save(self, filename):
+        '''
+        Save the starting position followed by every update in the ring buffer
+        '''
         with open(filename, 'w') as fn:
             fn.write(f'# STARTED AT: {self._startedAt}\n{json.dumps(self._dsStart)}\n')
             fn.write('\n# UPDATES\n')
@@ -338,12 +917,10 @@ class dataset():
 
         Note: history(0) would return the current version and history(1) is equivelant to prev()
         '''
-        dbUpdates = [v for v in self._ringBuffer if dbName in v]
-
-        d = deepcopy(self._dsStart[dbName]) if dbName in self._dsStart else {}
-        for i in range(len(dbUpdates)-abs(back)):
-            d = { **d, **dbUpdates[i] }
-        return self._Data(d)
+        if dbName not in self._versions:
+            return self._Data()
+        version = max(self._versions[dbName] - abs(back), self._floor[dbName])
+        return self._Version(self._keyHistory[dbName], version, partial(self._oldestVersion, dbName))
 
     class _Data(dict):
         def __init__(self, *args, **kwargs):
@@ -351,17 +928,70 @@ class dataset():
             for k, v in self.items():
                 self.__dict__[k] = v
 
+    class _Version(Mapping):
+        '''
+        Read-only view of a database as it was at a particular version.  Values are
+        looked up in the dataset's history index when they are used rather than copied.
+        If updates made since the view was created have discarded that version, the
+        oldest version that still exists is used instead.
+        '''
+        def __init__(self, keyHistory, version, oldest=None):
+            self._keyHistory = keyHistory
+            self._requested = version
+            self._oldest = oldest
+
+        @property
+        def _version(self):
+            return max(self._requested, self._oldest()) if self._oldest else self._requested
+
+        def __getitem__(self, key):
+            try:
+                versions, values = self._keyHistory[key]
+            except KeyError:
+                raise KeyError(key) from None
+            i = bisect_right(versions, self._version) - 1
+            if i < 0:
+                raise KeyError(key)
+            return values[i]
+
+        def __getattr__(self, name):
+            if name[0] == '_':
+                raise AttributeError(name)
+            try:
+                return self[name]
+            except KeyError:
+                raise AttributeError(name) from None
+
+        def __iter__(self):
+            version = self._version
+            return (k for k, (versions, values) in list(self._keyHistory.items()) if versions and versions[0] <= version)
+
+        def __len__(self):
+            return sum(1 for k in self)
+
+        def __repr__(self):
+            return dict(self).__repr__()
 
     @property
     def prev(self):
         '''
         Returns a dataset composed of the version of the databases that is one update behind the current versions
         '''
-        return self._Data(self._prevDS)
+        if self._prev is None:
+            self._prev = self._Data({
+                db: self._Version(self._keyHistory[db], max(v - 1, 1), partial(self._oldestVersion, db)) for db, v in self._versions.items()
+            })
+        return self._prev
 
 
 
 
+''' Identifies the statement currently being evaluated so that functions called from
+    within eval (e.g. changed) know which statement called them.  Each thread (and
+    asyncio task) sees its own value so evaluations can run concurrently. '''
+_currentCodeID = ContextVar('currentCodeID', default=None)
+
+
 class evaluate():
 
     __allowedBuiltIns = {
@@ -410,16 +1040,10 @@ class evaluate():
         self._allowedBuiltIns['history'] = self._dataset.history
         self._allowedMethods = list(self.__allowedMethods)
 
-        ''' Used to support methods that will be called by eval but need to be
-            able to distinguish which object is calling it (e.g. changed)
-            _evalLock protects usage of _currentCodeID if this code is used
-            in a multithreaded application.  '''
-        self._currentCodeID = None
-        self._evalLock = RLock()
-
     def _isChanged(self, value):
-        ret = False if self._currentCodeID not in self._changed else True if self._changed.get(self._currentCodeID) != value else False
-        self._changed[self._currentCodeID] = value
+        codeID = _currentCodeID.get()
+        ret = False if codeID not in self._changed else True if self._changed.get(codeID) != value else False
+        self._changed[codeID] = value
         return ret
 
     @staticmethod
@@ -433,6 +1057,13 @@ class evaluate():
 
 
     def compile(self, input, dataset=None, data=None):
+        '''
+        Compile input for later evaluation.
+
+        :return: tuple of the compiled code, the original input and the set of (database, key)
+            pairs the statement reads (key is None if the whole database is used).  The set is None
+            if the statement's dependencies can not be determined.
+        '''
         if data and dataset:
             raise RuntimeError(f'You can provide data or a dataset but not both')
 
@@ -441,18 +1072,53 @@ class evaluate():
         for name in code.co_names:
             if name not in self._allowedBuiltIns and name not in self._allowedMethods and name not in self._dataset and name not in dataset:
                 raise NameError(f'While compiling \'{input}\' discovered {name} which is not a valid function or variable')
-        return (code, input)
-
+        return (code, input, self._dependencies(input, dataset))
+
+    # Names whose value can change without the dataset being updated
+    __volatile = ['changed', 'time']
+
+    def _dependencies(self, input, dataset):
+        tree = ast.parse(input, mode='eval')
+        deps = set()
+        used = set()  # Name nodes already accounted for as part of a more specific dependency
+
+        def constant(node):
+            node = node.value if isinstance(node, ast.Index) else node
+            return node.value if isinstance(node, ast.Constant) else None
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id not in dataset:
+                key = constant(node.slice)
+                if type(key) in [str, int, float, bool] and node.value.id in self._dataset:
+                    deps.add((node.value.id, key))
+                    used.add(node.value)
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'prev':
+                deps.add((node.attr, None))
+                used.add(node.value)
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'history':
+                db = constant(node.args[0]) if node.args else None
+                if type(db) is not str:
+                    return None
+                deps.add((db, None))
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node not in used:
+                if node.id in self.__volatile or node.id in dataset or node.id == 'prev':
+                    return None
+                if node.id in self._dataset:
+                    deps.add((node.id, None))
+        return frozenset(deps)
 
     def eval(self, f, dataset=None, data=None, suppressErrors=False, returnOnError=''):
         if data and dataset:
             raise RuntimeError(f'You can provide data or a dataset but not both')
         dataset = dataset if dataset else data if data else None
 
-        d = { **self._dataset, **dataset } if dataset else self._dataset
+        # Resolve names from the local dataset first and then the shared one without copying either
+        d = ChainMap(dataset, self._dataset) if dataset else self._dataset
 
         # If we've receive a tuple it was hopefully produced by evaluate.compile
-        f, s = f if type(f) == tuple else (f, None)
+        f, s = f[0:2] if type(f) == tuple else (f, None)
 
         # If we've received a compilation from evaluate.compile, evaluate it and return the answer
         if f.__class__.__name__ == 'code':
@@ -473,9 +1139,7 @@ class evaluate():
             This in effect causes widgets to be blank when there is an error in the evaluated statement
             (such as a missing key in the dataset) '''
 
-        # Need to protect evaluation due to shared self._currentCodeID possibility
-        self._evalLock.acquire()
-        self._currentCodeID = id(code)
+        token = _currentCodeID.set(id(code))
         try:
             return eval(code, { '__builtins__': self._allowedBuiltIns }, variables )
         except KeyError as e:
@@ -489,7 +1153,7 @@ class evaluate():
         except AttributeError as e:
             raise AttributeError(f'Attribute Error: {e} while trying to evalute {input}')
         finally:
-            self._evalLock.release()
+            _currentCodeID.reset(token)
 
 
 def printImage(img):
@@ -500,3 +1164,49 @@ def printImage(img):
             s += f'{i:>08b}'.replace('0', ' ').replace('1', '*')
         print (f'|{s[0:img.size[0]]}|')
     print ('-'*(img.size[0]+2))
+
+
+def intersectBox(a, b):
+    '''
+    Returns the intersection of two (x0, y0, x1, y1) boxes or None if they do not overlap
+    '''
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def unionBox(boxes):
+    '''
+    Returns the smallest box that contains all of the provided boxes or None if no boxes were provided
+    '''
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes)
+    )
+
+
+def mergeBoxes(boxes, bounds=None):
+    '''
+    Clip a list of (x0, y0, x1, y1) boxes to bounds (if provided), discard any that are empty
+    and merge the ones that overlap so that no area is listed more than once
+    '''
+    merged = []
+    for b in boxes:
+        b = intersectBox(b, bounds) if bounds else b if b[0] < b[2] and b[1] < b[3] else None
+        if not b:
+            continue
+
+        # Absorb every existing box that overlaps the new one until no overlaps remain
+        overlapped = True
+        while overlapped:
+            overlapped = False
+            for m in merged:
+                if intersectBox(m, b):
+                    merged.remove(m)
+                    b = unionBox((m, b))
+                    overlapped = True
+                    break
+        merged.append(b)
+    return merged